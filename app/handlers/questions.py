@@ -3,17 +3,26 @@ Professional Interior Design Survey Handler for AI Assistant Bot
 Handles specialized interior design survey with professional questions
 """
 
+import asyncio
 import logging
+from collections import defaultdict
+from html import escape
+from typing import Dict, List, Any
 from aiogram import Router, types, F
-from aiogram.filters import Command
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, StateFilter
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import ErrorEvent, Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.methods import SendMessage
 
+from app.middlewares import UserIdMiddleware
 from app.services.database import DatabaseService
 
 logger = logging.getLogger(__name__)
 router = Router()
+router.message.middleware(UserIdMiddleware())
+router.callback_query.middleware(UserIdMiddleware())
 
 # Professional interior design survey states
 class DesignSurveyStates(StatesGroup):
@@ -42,1036 +51,761 @@ class DesignSurveyStates(StatesGroup):
     waiting_family_needs = State()
     waiting_personal_touch = State()
 
-# Design style options with descriptions
-DESIGN_STYLES = {
-    'modern': {
-        'name': 'Современный (Modern)',
-        'description': 'Чистые линии, минимализм, функциональность',
-        'keywords': ['минимализм', 'функциональность', 'технологии', 'открытое пространство']
-    },
-    'classic': {
-        'name': 'Классический (Classic)',
-        'description': 'Элегантность, традиции, роскошь',
-        'keywords': ['элегантность', 'традиции', 'роскошь', 'симметрия']
-    },
-    'scandinavian': {
-        'name': 'Скандинавский (Scandinavian)',
-        'description': 'Светлость, натуральные материалы, уют',
-        'keywords': ['светлость', 'натуральность', 'уют', 'простота']
-    },
-    'industrial': {
-        'name': 'Индустриальный (Industrial)',
-        'description': 'Открытые коммуникации, металл, бетон',
-        'keywords': ['открытость', 'металл', 'бетон', 'лофт']
-    },
-    'rustic': {
-        'name': 'Рустик (Rustic)',
-        'description': 'Натуральность, теплота, деревенский шарм',
-        'keywords': ['натуральность', 'теплота', 'деревенский', 'дерево']
-    },
-    'contemporary': {
-        'name': 'Современный эклектичный (Contemporary)',
-        'description': 'Смешение стилей, индивидуальность, тренды',
-        'keywords': ['эклектика', 'индивидуальность', 'тренды', 'креативность']
-    }
-}
-
-@router.message(Command("test"))
-async def start_design_survey(message: Message, state: FSMContext):
-    """Start the professional interior design survey."""
-    try:
-        user = message.from_user
-        db_service = DatabaseService()
-        
-        # Clear any existing state
-        await state.clear()
-        
-        # Set survey mode flag in database
-        db_service.update_user_field(user.id, 'in_survey_mode', True)
-        
-        # Show survey introduction
-        intro_text = """🎨 ** ТЕСТ ПО ДИЗАЙНУ ИНТЕРЬЕРА**
-
-⏱ **Время:** 10-15 минут
-
-🚀 **Начинаем с выбора стиля!**"""
-        
-        await message.answer(intro_text, parse_mode="Markdown")
-        await ask_style_preference(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error starting design survey: {e}")
-        await message.answer("Произошла ошибка при запуске теста. Попробуйте /start")
-
-async def ask_style_preference(message: Message, state: FSMContext):
-    """Ask for design style preference with visual examples."""
-    try:
-        # Create inline keyboard with style options
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🏗️ Современный", callback_data="style_modern")],
-            [InlineKeyboardButton(text="👑 Классический", callback_data="style_classic")],
-            [InlineKeyboardButton(text="🌲 Скандинавский", callback_data="style_scandinavian")],
-            [InlineKeyboardButton(text="⚙️ Индустриальный", callback_data="style_industrial")],
-            [InlineKeyboardButton(text="🪵 Рустик", callback_data="style_rustic")],
-            [InlineKeyboardButton(text="🎭 Современный эклектичный", callback_data="style_contemporary")]
-        ])
-        
-        style_text = """🎨 **ВОПРОС 1: Выберите ваш любимый стиль дизайна**
+# Design style options as parallel tuples, indexed by the style button position
+STYLE_KEYS = ('modern', 'classic', 'scandinavian', 'industrial', 'rustic', 'contemporary')
+STYLE_LABELS = (
+    "🏗️ Современный",
+    "👑 Классический",
+    "🌲 Скандинавский",
+    "⚙️ Индустриальный",
+    "🪵 Рустик",
+    "🎭 Современный эклектичный",
+)
+STYLE_NAMES = (
+    'Современный (Modern)',
+    'Классический (Classic)',
+    'Скандинавский (Scandinavian)',
+    'Индустриальный (Industrial)',
+    'Рустик (Rustic)',
+    'Современный эклектичный (Contemporary)',
+)
+STYLE_DESCRIPTIONS = (
+    'Чистые линии, минимализм, функциональность',
+    'Элегантность, традиции, роскошь',
+    'Светлость, натуральные материалы, уют',
+    'Открытые коммуникации, металл, бетон',
+    'Натуральность, теплота, деревенский шарм',
+    'Смешение стилей, индивидуальность, тренды',
+)
+STYLE_KEYWORDS = (
+    ('минимализм', 'функциональность', 'технологии', 'открытое пространство'),
+    ('элегантность', 'традиции', 'роскошь', 'симметрия'),
+    ('светлость', 'натуральность', 'уют', 'простота'),
+    ('открытость', 'металл', 'бетон', 'лофт'),
+    ('натуральность', 'теплота', 'деревенский', 'дерево'),
+    ('эклектика', 'индивидуальность', 'тренды', 'креативность'),
+)
+
+class StyleCallback(CallbackData, prefix="s"):
+    """Callback data of a style button: index into STYLE_KEYS."""
+    idx: int
+
+# Inline keyboard with style options, shared by every survey start
+STYLE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=label, callback_data=StyleCallback(idx=idx).pack())]
+    for idx, label in enumerate(STYLE_LABELS)
+])
+
+# Survey texts are built once at import time
+SURVEY_INTRO_TEXT_RU = """🎨 <b> ТЕСТ ПО ДИЗАЙНУ ИНТЕРЬЕРА</b>
+
+⏱ <b>Время:</b> 10-15 минут
+
+🚀 <b>Начинаем с выбора стиля!</b>"""
+
+STYLE_QUESTION_TEXT = """🎨 <b>ВОПРОС 1: Выберите ваш любимый стиль дизайна</b>
 
 Каждый стиль имеет свои уникальные характеристики:
 
-🏗️ **Современный (Modern)**
+🏗️ <b>Современный (Modern)</b>
 • Чистые линии и минимализм
 • Функциональность превыше всего
 • Открытые пространства
 • Современные технологии
 
-👑 **Классический (Classic)**
+👑 <b>Классический (Classic)</b>
 • Элегантность и традиции
 • Роскошные материалы
 • Симметричные композиции
 • Вневременная красота
 
-🌲 **Скандинавский (Scandinavian)**
+🌲 <b>Скандинавский (Scandinavian)</b>
 • Светлость и простота
 • Натуральные материалы
 • Уютная атмосфера
 • Функциональный дизайн
 
-⚙️ **Индустриальный (Industrial)**
+⚙️ <b>Индустриальный (Industrial)</b>
 • Открытые коммуникации
 • Металл и бетон
 • Лофт-эстетика
 • Урбанистический стиль
 
-🪵 **Рустик (Rustic)**
+🪵 <b>Рустик (Rustic)</b>
 • Натуральность и теплота
 • Деревенский шарм
 • Текстурированные материалы
 • Уютная атмосфера
 
-🎭 **Современный эклектичный (Contemporary)**
+🎭 <b>Современный эклектичный (Contemporary)</b>
 • Смешение стилей
 • Индивидуальность
 • Современные тренды
 • Креативность
 
 Выберите стиль, который больше всего отражает ваши предпочтения:"""
-        
-        await message.answer(style_text, parse_mode="Markdown", reply_markup=keyboard)
-        await state.set_state(DesignSurveyStates.waiting_style_choice)
-        
-    except Exception as e:
-        logger.error(f"Error asking style preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.callback_query(lambda c: c.data.startswith('style_'))
-async def handle_style_choice(callback_query: types.CallbackQuery, state: FSMContext):
-    """Handle style choice selection."""
-    try:
-        user_id = callback_query.from_user.id
-        db_service = DatabaseService()
-        
-        # Extract style from callback data
-        style = callback_query.data.replace('style_', '')
-        
-        # Store style choice
-        db_service.update_user_field(user_id, 'preferred_style', style)
-        db_service.update_user_field(user_id, 'style_description', DESIGN_STYLES[style]['description'])
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, f"Выбран стиль: {DESIGN_STYLES[style]['name']}", "user")
-        
-        # Confirm choice and move to next question
-        confirm_text = f"""✅ **Стиль выбран: {DESIGN_STYLES[style]['name']}**
-
-{DESIGN_STYLES[style]['description']}
-
-Переходим к следующему вопросу..."""
-        
-        await callback_query.message.edit_text(confirm_text, parse_mode="Markdown")
-        
-        # Move to color preference question
-        await ask_color_preference(callback_query.message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling style choice: {e}")
-        await callback_query.answer("Произошла ошибка. Попробуйте еще раз.")
-
-async def ask_color_preference(message: Message, state: FSMContext):
-    """Ask for color preference."""
-    try:
-        color_text = """🎨 **ВОПРОС 2: Цветовая палитра**
+
+COLOR_QUESTION_TEXT = """🎨 <b>ВОПРОС 2: Цветовая палитра</b>
 
 Какие цвета вызывают у вас положительные эмоции?
 
-**Основные палитры:**
+<b>Основные палитры:</b>
 
-🌞 **Теплые тона**
+🌞 <b>Теплые тона</b>
 • Бежевый, кремовый, песочный
 • Терракотовый, коричневый
 • Желтый, оранжевый
 • Создают уютную, гостеприимную атмосферу
 
-❄️ **Холодные тона**
+❄️ <b>Холодные тона</b>
 • Белый, серый, голубой
 • Синий, фиолетовый
 • Зеленый, мятный
 • Дарят спокойствие и свежесть
 
-🌈 **Яркие акценты**
+🌈 <b>Яркие акценты</b>
 • Красный, розовый, малиновый
 • Зеленый, бирюзовый
 • Желтый, оранжевый
 • Добавляют энергии и индивидуальности
 
-🎭 **Монохромные**
+🎭 <b>Монохромные</b>
 • Оттенки одного цвета
 • Черно-белая гамма
 • Элегантность и минимализм
 
-**Напишите, какие цвета вам нравятся больше всего, или выберите палитру из списка выше.**"""
-        
-        await message.answer(color_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_color_preference)
-        
-    except Exception as e:
-        logger.error(f"Error asking color preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_color_preference)
-async def handle_color_preference(message: Message, state: FSMContext):
-    """Handle color preference response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store color preference
-        db_service.update_user_field(user_id, 'color_preference', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_material_preference(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling color preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какие цвета вам нравятся больше всего, или выберите палитру из списка выше.</b>"""
 
-async def ask_material_preference(message: Message, state: FSMContext):
-    """Ask for material preference."""
-    try:
-        material_text = """🏗️ **ВОПРОС 3: Материалы и текстуры**
+MATERIAL_QUESTION_TEXT = """🏗️ <b>ВОПРОС 3: Материалы и текстуры</b>
 
 Какие материалы вызывают у вас приятные тактильные ощущения?
 
-**Основные категории материалов:**
+<b>Основные категории материалов:</b>
 
-🌳 **Натуральные материалы**
+🌳 <b>Натуральные материалы</b>
 • Дерево (дуб, ясень, сосна)
 • Камень (мрамор, гранит, известняк)
 • Натуральные ткани (лен, хлопок, шерсть)
 • Кожа и замша
 
-🔧 **Современные материалы**
+🔧 <b>Современные материалы</b>
 • Металл (сталь, алюминий, латунь)
 • Стекло и зеркала
 • Бетон и керамика
 • Искусственные ткани
 
-💎 **Роскошные материалы**
+💎 <b>Роскошные материалы</b>
 • Мрамор и гранит
 • Драгоценные породы дерева
 • Шелк и бархат
 • Хрусталь и фарфор
 
-**Напишите, какие материалы вам нравятся, или выберите категорию из списка выше.**"""
-        
-        await message.answer(material_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_material_preference)
-        
-    except Exception as e:
-        logger.error(f"Error asking material preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_material_preference)
-async def handle_material_preference(message: Message, state: FSMContext):
-    """Handle material preference response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store material preference
-        db_service.update_user_field(user_id, 'material_preference', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_space_type(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling material preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какие материалы вам нравятся, или выберите категорию из списка выше.</b>"""
 
-async def ask_space_type(message: Message, state: FSMContext):
-    """Ask for space type preference."""
-    try:
-        space_text = """🏠 **ВОПРОС 4: Тип пространства**
+SPACE_QUESTION_TEXT = """🏠 <b>ВОПРОС 4: Тип пространства</b>
 
 Какой тип жилого пространства вы планируете обустраивать?
 
-**Жилые пространства:**
-🏡 **Частный дом**
+<b>Жилые пространства:</b>
+🏡 <b>Частный дом</b>
 • Больше возможностей для планировки
 • Связь с природой
 • Индивидуальность
 
-🏢 **Квартира**
+🏢 <b>Квартира</b>
 • Компактность и функциональность
 • Городская среда
 • Социальная инфраструктура
 
-🏰 **Пентхаус/Лофт**
+🏰 <b>Пентхаус/Лофт</b>
 • Высота и панорамные виды
 • Открытые пространства
 • Премиум-статус
 
-**Напишите, какой тип жилого пространства вас интересует, или выберите из списка выше.**"""
-        
-        await message.answer(space_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_space_type)
-        
-    except Exception as e:
-        logger.error(f"Error asking space type: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_space_type)
-async def handle_space_type(message: Message, state: FSMContext):
-    """Handle space type response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store space type
-        db_service.update_user_field(user_id, 'space_type', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_room_preference(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling space type: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какой тип жилого пространства вас интересует, или выберите из списка выше.</b>"""
 
-async def ask_room_preference(message: Message, state: FSMContext):
-    """Ask for room preference."""
-    try:
-        room_text = """🚪 **ВОПРОС 5: Приоритетные помещения**
+ROOM_QUESTION_TEXT = """🚪 <b>ВОПРОС 5: Приоритетные помещения</b>
 
 Какие помещения для вас наиболее важны?
 
-**Основные помещения:**
-🛋️ **Гостиная**
+<b>Основные помещения:</b>
+🛋️ <b>Гостиная</b>
 • Центр семейной жизни
 • Прием гостей
 • Отдых и развлечения
 
-🍽️ **Кухня**
+🍽️ <b>Кухня</b>
 • Приготовление пищи
 • Семейные завтраки
 • Социальное пространство
 
-🛏️ **Спальня**
+🛏️ <b>Спальня</b>
 • Отдых и восстановление
 • Личное пространство
 • Уют и комфорт
 
-🛁 **Ванная комната**
+🛁 <b>Ванная комната</b>
 • Утренние процедуры
 • Расслабление
 • Функциональность
 
-🏠 **Прихожая**
+🏠 <b>Прихожая</b>
 • Первое впечатление
 • Хранение вещей
 • Переход между зонами
 
-**Напишите, какие помещения для вас приоритетны, или выберите из списка выше.**"""
-        
-        await message.answer(room_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_room_preference)
-        
-    except Exception as e:
-        logger.error(f"Error asking room preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_room_preference)
-async def handle_room_preference(message: Message, state: FSMContext):
-    """Handle room preference response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store room preference
-        db_service.update_user_field(user_id, 'room_preference', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_layout_style(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling room preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какие помещения для вас приоритетны, или выберите из списка выше.</b>"""
 
-async def ask_layout_style(message: Message, state: FSMContext):
-    """Ask for layout style preference."""
-    try:
-        layout_text = """📐 **ВОПРОС 6: Стиль планировки**
+LAYOUT_QUESTION_TEXT = """📐 <b>ВОПРОС 6: Стиль планировки</b>
 
 Какой стиль планировки вам больше нравится?
 
-**Типы планировок:**
+<b>Типы планировок:</b>
 
-🏠 **Открытая планировка (Open Plan)**
+🏠 <b>Открытая планировка (Open Plan)</b>
 • Минимум перегородок
 • Светлые пространства
 • Социальное взаимодействие
 • Современный подход
 
-🚪 **Зонированная планировка (Zoned)**
+🚪 <b>Зонированная планировка (Zoned)</b>
 • Четкое разделение функций
 • Приватность помещений
 • Традиционный подход
 • Структурированность
 
-🔄 **Гибкая планировка (Flexible)**
+🔄 <b>Гибкая планировка (Flexible)</b>
 • Трансформируемые пространства
 • Многофункциональность
 • Адаптивность
 • Инновационность
 
-**Напишите, какой стиль планировки вам больше подходит, или выберите из списка выше.**"""
-        
-        await message.answer(layout_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_layout_style)
-        
-    except Exception as e:
-        logger.error(f"Error asking layout style: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_layout_style)
-async def handle_layout_style(message: Message, state: FSMContext):
-    """Handle layout style response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store layout style
-        db_service.update_user_field(user_id, 'layout_style', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_functionality(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling layout style: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какой стиль планировки вам больше подходит, или выберите из списка выше.</b>"""
 
-async def ask_functionality(message: Message, state: FSMContext):
-    """Ask for functionality preferences."""
-    try:
-        functionality_text = """⚙️ **ВОПРОС 7: Функциональные потребности**
+FUNCTIONALITY_QUESTION_TEXT = """⚙️ <b>ВОПРОС 7: Функциональные потребности</b>
 
 Какие функции для вас наиболее важны?
 
-**Основные функции:**
+<b>Основные функции:</b>
 
-💻 **Технологичность**
+💻 <b>Технологичность</b>
 • Умный дом
 • Автоматизация
 • Медиа-системы
 • Энергоэффективность
 
-📚 **Хранение**
+📚 <b>Хранение</b>
 • Встроенные шкафы
 • Системы хранения
 • Организация вещей
 • Многофункциональная мебель
 
-🌱 **Экологичность**
+🌱 <b>Экологичность</b>
 • Натуральные материалы
 • Энергосбережение
 • Переработка
 • Устойчивое развитие
 
-**Напишите, какие функции для вас приоритетны, или выберите из списка выше.**"""
-        
-        await message.answer(functionality_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_functionality)
-        
-    except Exception as e:
-        logger.error(f"Error asking functionality: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_functionality)
-async def handle_functionality(message: Message, state: FSMContext):
-    """Handle functionality response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store functionality preference
-        db_service.update_user_field(user_id, 'functionality_preference', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_lighting_preference(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling functionality: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какие функции для вас приоритетны, или выберите из списка выше.</b>"""
 
-async def ask_lighting_preference(message: Message, state: FSMContext):
-    """Ask for lighting preference."""
-    try:
-        lighting_text = """💡 **ВОПРОС 8: Предпочтения в освещении**
+LIGHTING_QUESTION_TEXT = """💡 <b>ВОПРОС 8: Предпочтения в освещении</b>
 
 Какой тип освещения вам больше нравится?
 
-**Типы освещения:**
+<b>Типы освещения:</b>
 
-☀️ **Естественное освещение**
+☀️ <b>Естественное освещение</b>
 • Большие окна
 • Световые колодцы
 • Зеркальные поверхности
 • Светлые тона
 
-💡 **Искусственное освещение**
+💡 <b>Искусственное освещение</b>
 • Точечные светильники
 • Подсветка
 • Настенные бра
 • Декоративные лампы
 
-🌅 **Комбинированное освещение**
+🌅 <b>Комбинированное освещение</b>
 • Естественный + искусственный свет
 • Автоматическое управление
 • Разные сценарии освещения
 • Адаптивность
 
-**Напишите, какой тип освещения вам больше подходит, или выберите из списка выше.**"""
-        
-        await message.answer(lighting_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_lighting_preference)
-        
-    except Exception as e:
-        logger.error(f"Error asking lighting preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_lighting_preference)
-async def handle_lighting_preference(message: Message, state: FSMContext):
-    """Handle lighting preference response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store lighting preference
-        db_service.update_user_field(user_id, 'lighting_preference', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_storage_preference(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling lighting preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какой тип освещения вам больше подходит, или выберите из списка выше.</b>"""
 
-async def ask_storage_preference(message: Message, state: FSMContext):
-    """Ask for storage preference."""
-    try:
-        storage_text = """🗄️ **ВОПРОС 9: Системы хранения**
+STORAGE_QUESTION_TEXT = """🗄️ <b>ВОПРОС 9: Системы хранения</b>
 
 Какие системы хранения вам нужны?
 
-**Типы хранения:**
+<b>Типы хранения:</b>
 
-📦 **Встроенные системы**
+📦 <b>Встроенные системы</b>
 • Встроенные шкафы
 • Ниши и полки
 • Многофункциональная мебель
 • Скрытое хранение
 
-🎨 **Декоративные системы**
+🎨 <b>Декоративные системы</b>
 • Открытые полки
 • Стеллажи
 • Корзины и коробки
 • Видимые системы хранения
 
-🔒 **Функциональные системы**
+🔒 <b>Функциональные системы</b>
 • Гардеробные комнаты
 • Кладовые
 • Технические помещения
 • Специализированное хранение
 
-**Напишите, какие системы хранения вам нужны, или выберите из списка выше.**"""
-        
-        await message.answer(storage_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_storage_preference)
-        
-    except Exception as e:
-        logger.error(f"Error asking storage preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_storage_preference)
-async def handle_storage_preference(message: Message, state: FSMContext):
-    """Handle storage preference response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store storage preference
-        db_service.update_user_field(user_id, 'storage_preference', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_budget_range(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling storage preference: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какие системы хранения вам нужны, или выберите из списка выше.</b>"""
 
-async def ask_budget_range(message: Message, state: FSMContext):
-    """Ask for budget range."""
-    try:
-        budget_text = """💰 **ВОПРОС 10: Бюджетный диапазон**
+BUDGET_QUESTION_TEXT = """💰 <b>ВОПРОС 10: Бюджетный диапазон</b>
 
 Какой бюджет вы планируете на проект?
 
-**Бюджетные категории:**
+<b>Бюджетные категории:</b>
 
-💸 **Экономный (до $50,000)**
+💸 <b>Экономный (до $50,000)</b>
 • Базовые материалы
 • Простые решения
 • DIY элементы
 • Функциональность
 
-💵 **Средний ($50,000 - $150,000)**
+💵 <b>Средний ($50,000 - $150,000)</b>
 • Качественные материалы
 • Профессиональные решения
 • Дизайнерская мебель
 • Баланс цены и качества
 
-💎 **Премиум ($150,000+)**
+💎 <b>Премиум ($150,000+)</b>
 • Люксовые материалы
 • Индивидуальные решения
 • Дизайнерская мебель
 • Максимальное качество
 
-**Напишите ваш бюджетный диапазон или выберите категорию из списка выше.**"""
-        
-        await message.answer(budget_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_budget_range)
-        
-    except Exception as e:
-        logger.error(f"Error asking budget range: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_budget_range)
-async def handle_budget_range(message: Message, state: FSMContext):
-    """Handle budget range response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store budget range
-        db_service.update_user_field(user_id, 'budget_range', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_timeline(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling budget range: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите ваш бюджетный диапазон или выберите категорию из списка выше.</b>"""
 
-async def ask_timeline(message: Message, state: FSMContext):
-    """Ask for project timeline."""
-    try:
-        timeline_text = """⏰ **ВОПРОС 11: Временные рамки**
+TIMELINE_QUESTION_TEXT = """⏰ <b>ВОПРОС 11: Временные рамки</b>
 
 Какие временные рамки у вашего проекта?
 
-**Временные категории:**
+<b>Временные категории:</b>
 
-🚀 **Срочно (1-3 месяца)**
+🚀 <b>Срочно (1-3 месяца)</b>
 • Быстрые решения
 • Готовые элементы
 • Минимальные изменения
 • Оперативность
 
-📅 **Средний срок (3-6 месяцев)**
+📅 <b>Средний срок (3-6 месяцев)</b>
 • Планирование и подготовка
 • Качественные материалы
 • Профессиональный подход
 • Баланс времени и качества
 
-🕐 **Нет спешки (6+ месяцев)**
+🕐 <b>Нет спешки (6+ месяцев)</b>
 • Детальное планирование
 • Индивидуальные решения
 • Люксовые материалы
 • Максимальное качество
 
-**Напишите ваши временные рамки или выберите категорию из списка выше.**"""
-        
-        await message.answer(timeline_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_timeline)
-        
-    except Exception as e:
-        logger.error(f"Error asking timeline: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_timeline)
-async def handle_timeline(message: Message, state: FSMContext):
-    """Handle timeline response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store timeline
-        db_service.update_user_field(user_id, 'timeline', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_priority(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling timeline: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите ваши временные рамки или выберите категорию из списка выше.</b>"""
 
-async def ask_priority(message: Message, state: FSMContext):
-    """Ask for project priorities."""
-    try:
-        priority_text = """🎯 **ВОПРОС 12: Приоритеты проекта**
+PRIORITY_QUESTION_TEXT = """🎯 <b>ВОПРОС 12: Приоритеты проекта</b>
 
 Что для вас важнее всего в проекте?
 
-**Приоритетные аспекты:**
+<b>Приоритетные аспекты:</b>
 
-🏠 **Функциональность**
+🏠 <b>Функциональность</b>
 • Удобство использования
 • Практичность
 • Эргономика
 • Эффективность
 
-🎨 **Эстетика**
+🎨 <b>Эстетика</b>
 • Красота и стиль
 • Визуальная привлекательность
 • Гармония и баланс
 • Индивидуальность
 
-💰 **Экономия**
+💰 <b>Экономия</b>
 • Оптимизация бюджета
 • Долговечность
 • Энергоэффективность
 • Разумные траты
 
-**Напишите, что для вас важнее всего, или выберите из списка выше.**"""
-        
-        await message.answer(priority_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_priority)
-        
-    except Exception as e:
-        logger.error(f"Error asking priority: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_priority)
-async def handle_priority(message: Message, state: FSMContext):
-    """Handle priority response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store priority
-        db_service.update_user_field(user_id, 'project_priority', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_lifestyle(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling priority: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, что для вас важнее всего, или выберите из списка выше.</b>"""
 
-async def ask_lifestyle(message: Message, state: FSMContext):
-    """Ask for lifestyle preferences."""
-    try:
-        lifestyle_text = """🌟 **ВОПРОС 13: Образ жизни**
+LIFESTYLE_QUESTION_TEXT = """🌟 <b>ВОПРОС 13: Образ жизни</b>
 
 Какой у вас образ жизни?
 
-**Типы образа жизни:**
+<b>Типы образа жизни:</b>
 
-🏠 **Домашний**
+🏠 <b>Домашний</b>
 • Много времени дома
 • Семейные ценности
 • Уют и комфорт
 • Приватность
 
-🌍 **Активный**
+🌍 <b>Активный</b>
 • Путешествия и спорт
 • Социальная активность
 • Динамичность
 • Открытость
 
-💼 **Деловой**
+💼 <b>Деловой</b>
 • Работа из дома
 • Встречи и переговоры
 • Профессиональная среда
 • Функциональность
 
-**Напишите, какой у вас образ жизни, или выберите из списка выше.**"""
-        
-        await message.answer(lifestyle_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_lifestyle)
-        
-    except Exception as e:
-        logger.error(f"Error asking lifestyle: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_lifestyle)
-async def handle_lifestyle(message: Message, state: FSMContext):
-    """Handle lifestyle response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store lifestyle
-        db_service.update_user_field(user_id, 'lifestyle', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_family_needs(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling lifestyle: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите, какой у вас образ жизни, или выберите из списка выше.</b>"""
 
-async def ask_family_needs(message: Message, state: FSMContext):
-    """Ask for family needs."""
-    try:
-        family_text = """👨‍👩‍👧‍👦 **ВОПРОС 14: Семейные потребности**
+FAMILY_QUESTION_TEXT = """👨‍👩‍👧‍👦 <b>ВОПРОС 14: Семейные потребности</b>
 
 Какие у вас семейные потребности?
 
-**Семейные ситуации:**
+<b>Семейные ситуации:</b>
 
-👤 **Один человек**
+👤 <b>Один человек</b>
 • Личное пространство
 • Индивидуальность
 • Функциональность
 • Минимализм
 
-👫 **Пара**
+👫 <b>Пара</b>
 • Романтическая атмосфера
 • Совместное время
 • Личное пространство
 • Гостеприимство
 
-👨‍👩‍👧‍👦 **Семья с детьми**
+👨‍👩‍👧‍👦 <b>Семья с детьми</b>
 • Безопасность
 • Игровые зоны
 • Практичность
 • Долговечность
 
-👴 **Мультипоколенная семья**
+👴 <b>Мультипоколенная семья</b>
 • Доступность
 • Комфорт для всех возрастов
 • Функциональность
 • Универсальность
 
-**Напишите ваши семейные потребности или выберите из списка выше.**"""
-        
-        await message.answer(family_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_family_needs)
-        
-    except Exception as e:
-        logger.error(f"Error asking family needs: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_family_needs)
-async def handle_family_needs(message: Message, state: FSMContext):
-    """Handle family needs response."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store family needs
-        db_service.update_user_field(user_id, 'family_needs', message.text)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        await ask_personal_touch(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling family needs: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
+<b>Напишите ваши семейные потребности или выберите из списка выше.</b>"""
 
-async def ask_personal_touch(message: Message, state: FSMContext):
-    """Ask for personal touch preferences."""
-    try:
-        personal_text = """🎭 **ВОПРОС 15: Личные акценты**
+PERSONAL_QUESTION_TEXT = """🎭 <b>ВОПРОС 15: Личные акценты</b>
 
 Что сделает пространство по-настоящему вашим?
 
-**Личные элементы:**
+<b>Личные элементы:</b>
 
-🎨 **Хобби и увлечения**
+🎨 <b>Хобби и увлечения</b>
 • Творческие зоны
 • Коллекции
 • Специализированное оборудование
 • Индивидуальные решения
 
-🌍 **Культурные корни**
+🌍 <b>Культурные корни</b>
 • Национальные мотивы
 • Традиционные элементы
 • Культурные символы
 • Семейные реликвии
 
-💝 **Эмоциональные связи**
+💝 <b>Эмоциональные связи</b>
 • Любимые цвета
 • Значимые предметы
 • Воспоминания
 • Личные истории
 
-**Напишите, что сделает пространство по-настоящему вашим, или выберите из списка выше.**"""
-        
-        await message.answer(personal_text, parse_mode="Markdown")
-        await state.set_state(DesignSurveyStates.waiting_personal_touch)
-        
-    except Exception as e:
-        logger.error(f"Error asking personal touch: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-@router.message(DesignSurveyStates.waiting_personal_touch)
-async def handle_personal_touch(message: Message, state: FSMContext):
-    """Handle personal touch response and complete survey."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Store personal touch
-        db_service.update_user_field(user_id, 'personal_touch', message.text)
-        db_service.update_user_field(user_id, 'survey_completed', True)
-        db_service.update_user_field(user_id, 'in_survey_mode', False)
-        
-        # Store in conversation history
-        db_service.add_conversation_message(user_id, message.text, "user")
-        
-        # Complete survey
-        await complete_design_survey(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error handling personal touch: {e}")
-        await message.answer("Произошла ошибка. Попробуйте еще раз.")
-
-async def complete_design_survey(message: Message, state: FSMContext):
-    """Complete the design survey and show professional summary."""
-    try:
-        user_id = message.from_user.id
-        db_service = DatabaseService()
-        
-        # Get user session to show summary
-        user_session = db_service.get_user_session(user_id)
-        
-        # Create professional summary
-        summary = f"""🎉 **ПРОФЕССИОНАЛЬНЫЙ ТЕСТ ПО ДИЗАЙНУ ИНТЕРЬЕРА ЗАВЕРШЕН!**
+<b>Напишите, что сделает пространство по-настоящему вашим, или выберите из списка выше.</b>"""
 
-✅ Спасибо за прохождение теста! Теперь я знаю ваши предпочтения как профессиональный архитектор и дизайнер интерьеров.
-
-📊 **Ваш дизайн-профиль:**
-
-🎨 **Стиль:** {user_session.get('preferred_style', 'Не указано')}
-🎨 **Цвета:** {user_session.get('color_preference', 'Не указано')}
-🏗️ **Материалы:** {user_session.get('material_preference', 'Не указано')}
-🏠 **Тип пространства:** {user_session.get('space_type', 'Не указано')}
-🚪 **Помещения:** {user_session.get('room_preference', 'Не указано')}
-📐 **Планировка:** {user_session.get('layout_style', 'Не указано')}
-⚙️ **Функциональность:** {user_session.get('functionality_preference', 'Не указано')}
-💡 **Освещение:** {user_session.get('lighting_preference', 'Не указано')}
-🗄️ **Хранение:** {user_session.get('storage_preference', 'Не указано')}
-💰 **Бюджет:** {user_session.get('budget_range', 'Не указано')}
-⏰ **Время:** {user_session.get('timeline', 'Не указано')}
-🎯 **Приоритеты:** {user_session.get('project_priority', 'Не указано')}
-🌟 **Образ жизни:** {user_session.get('lifestyle', 'Не указано')}
-👨‍👩‍👧‍👦 **Семья:** {user_session.get('family_needs', 'Не указано')}
-🎭 **Личные акценты:** {user_session.get('personal_touch', 'Не указано')}
-
-💡 **Теперь я могу давать вам профессиональные дизайнерские советы на основе ваших предпочтений!**
-
-🚀 Можете задавать любые вопросы по дизайну, планировке, материалам или отправлять фотографии для профессионального анализа."""
-        
-        # Store completion message in conversation history
-        db_service.add_conversation_message(user_id, summary, "bot")
-        
-        await message.answer(summary, parse_mode="Markdown")
-        
-        # Clear state
-        await state.clear()
-        
-        logger.info(f"User {user_id} completed the professional design survey")
-        
-    except Exception as e:
-        logger.error(f"Error completing design survey: {e}")
-        await message.answer("Произошла ошибка при завершении теста.")
-
-@router.message(Command("survey"))
-async def start_survey_english(message: Message, state: FSMContext):
-    """Start survey in English."""
-    try:
-        user = message.from_user
-        db_service = DatabaseService()
-        
-        # Clear any existing state
-        await state.clear()
-        
-        # Set survey mode flag in database
-        db_service.update_user_field(user.id, 'in_survey_mode', True)
-        
-        # Show survey introduction in English
-        intro_text = """🎨 **PROFESSIONAL INTERIOR DESIGN SURVEY**
+SURVEY_INTRO_TEXT_EN = """🎨 <b>PROFESSIONAL INTERIOR DESIGN SURVEY</b>
 
 Hello! I'm a professional architect and interior designer with 20+ years of experience.
 
-🔍 **What we'll discover:**
+🔍 <b>What we'll discover:</b>
 • Your style and color preferences
 • Functional space requirements
 • Budget and timeline constraints
 • Lifestyle and family needs
 
-📊 **15 professional questions:**
+📊 <b>15 professional questions:</b>
 1-3: Style preferences
 4-6: Spatial solutions
 7-9: Functionality
 10-12: Budget and time
 13-15: Lifestyle
 
-⏱ **Time:** 10-15 minutes
+⏱ <b>Time:</b> 10-15 minutes
+
+🚀 <b>Let's start with style selection!</b>"""
+
+# Survey summary, filled with HTML-escaped profile fields
+SUMMARY_TEMPLATE = """🎉 <b>ПРОФЕССИОНАЛЬНЫЙ ТЕСТ ПО ДИЗАЙНУ ИНТЕРЬЕРА ЗАВЕРШЕН!</b>
+
+✅ Спасибо за прохождение теста! Теперь я знаю ваши предпочтения как профессиональный архитектор и дизайнер интерьеров.
+
+📊 <b>Ваш дизайн-профиль:</b>
+
+🎨 <b>Стиль:</b> {preferred_style}
+🎨 <b>Цвета:</b> {color_preference}
+🏗️ <b>Материалы:</b> {material_preference}
+🏠 <b>Тип пространства:</b> {space_type}
+🚪 <b>Помещения:</b> {room_preference}
+📐 <b>Планировка:</b> {layout_style}
+⚙️ <b>Функциональность:</b> {functionality_preference}
+💡 <b>Освещение:</b> {lighting_preference}
+🗄️ <b>Хранение:</b> {storage_preference}
+💰 <b>Бюджет:</b> {budget_range}
+⏰ <b>Время:</b> {timeline}
+🎯 <b>Приоритеты:</b> {project_priority}
+🌟 <b>Образ жизни:</b> {lifestyle}
+👨‍👩‍👧‍👦 <b>Семья:</b> {family_needs}
+🎭 <b>Личные акценты:</b> {personal_touch}
+
+💡 <b>Теперь я могу давать вам профессиональные дизайнерские советы на основе ваших предпочтений!</b>
+
+🚀 Можете задавать любые вопросы по дизайну, планировке, материалам или отправлять фотографии для профессионального анализа."""
+
+# Pre-built send requests for the static survey screens; only chat_id changes per send
+def _build_survey_request(text: str, reply_markup=None) -> SendMessage:
+    """Build a send request with a placeholder chat_id, filled in by send_survey_request."""
+    return SendMessage(chat_id=0, text=text, reply_markup=reply_markup)
+
+SURVEY_INTRO_REQUEST_RU = _build_survey_request(SURVEY_INTRO_TEXT_RU)
+STYLE_QUESTION_REQUEST = _build_survey_request(STYLE_QUESTION_TEXT, STYLE_KEYBOARD)
+COLOR_QUESTION_REQUEST = _build_survey_request(COLOR_QUESTION_TEXT)
+MATERIAL_QUESTION_REQUEST = _build_survey_request(MATERIAL_QUESTION_TEXT)
+SPACE_QUESTION_REQUEST = _build_survey_request(SPACE_QUESTION_TEXT)
+ROOM_QUESTION_REQUEST = _build_survey_request(ROOM_QUESTION_TEXT)
+LAYOUT_QUESTION_REQUEST = _build_survey_request(LAYOUT_QUESTION_TEXT)
+FUNCTIONALITY_QUESTION_REQUEST = _build_survey_request(FUNCTIONALITY_QUESTION_TEXT)
+LIGHTING_QUESTION_REQUEST = _build_survey_request(LIGHTING_QUESTION_TEXT)
+STORAGE_QUESTION_REQUEST = _build_survey_request(STORAGE_QUESTION_TEXT)
+BUDGET_QUESTION_REQUEST = _build_survey_request(BUDGET_QUESTION_TEXT)
+TIMELINE_QUESTION_REQUEST = _build_survey_request(TIMELINE_QUESTION_TEXT)
+PRIORITY_QUESTION_REQUEST = _build_survey_request(PRIORITY_QUESTION_TEXT)
+LIFESTYLE_QUESTION_REQUEST = _build_survey_request(LIFESTYLE_QUESTION_TEXT)
+FAMILY_QUESTION_REQUEST = _build_survey_request(FAMILY_QUESTION_TEXT)
+PERSONAL_QUESTION_REQUEST = _build_survey_request(PERSONAL_QUESTION_TEXT)
+SURVEY_INTRO_REQUEST_EN = _build_survey_request(SURVEY_INTRO_TEXT_EN)
+
+async def send_survey_request(message: Message, request: SendMessage, prefix: str = ""):
+    """Send a pre-built survey screen to the chat of the given message, optionally preceded by prefix."""
+    update = {'chat_id': message.chat.id}
+    if prefix:
+        update['text'] = prefix + request.text
+    await message.bot(request.model_copy(update=update))
+
+SURVEY_ERROR_TEXT = "Произошла ошибка. Попробуйте /start"
+
+# Errors bubble up from every router, so only those raised while a survey step is open are answered here
+@router.errors(StateFilter(DesignSurveyStates))
+async def handle_survey_error(event: ErrorEvent):
+    """Log a failure during the survey and tell the user how to recover."""
+    logger.exception("Error in survey handler: %s", event.exception)
+    
+    update = event.update
+    if update.message:
+        await update.message.answer(SURVEY_ERROR_TEXT)
+    elif update.callback_query:
+        await update.callback_query.answer(SURVEY_ERROR_TEXT)
+
+@router.message(Command("test"))
+async def start_design_survey(message: Message, state: FSMContext, user_id: int, db: DatabaseService):
+    """Start the professional interior design survey."""
+    # Clear any existing state, set survey mode flag in database and show survey introduction together
+    await asyncio.gather(
+        state.clear(),
+        db.update_user_field(user_id, 'in_survey_mode', True),
+        send_survey_request(message, SURVEY_INTRO_REQUEST_RU),
+    )
+    await ask_style_preference(message, state)
+
+async def ask_style_preference(message: Message, state: FSMContext):
+    """Ask for design style preference with visual examples."""
+    await send_survey_request(message, STYLE_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_style_choice)
 
-🚀 **Let's start with style selection!**"""
-        
-        await message.answer(intro_text, parse_mode="Markdown")
-        await ask_style_preference(message, state)
-        
-    except Exception as e:
-        logger.error(f"Error starting English survey: {e}")
-        await message.answer("An error occurred while starting the survey. Try /start")
\ No newline at end of file
+@router.callback_query(StyleCallback.filter(), DesignSurveyStates.waiting_style_choice)
+async def handle_style_choice(callback_query: types.CallbackQuery, callback_data: StyleCallback, state: FSMContext):
+    """Handle style choice selection."""
+    # Resolve style from the button index
+    idx = callback_data.idx
+    style = STYLE_KEYS[idx]
+    
+    # Confirm choice in the same message as the next question
+    confirm_text = f"""✅ <b>Стиль выбран: {STYLE_NAMES[idx]}</b>
+
+{STYLE_DESCRIPTIONS[idx]}
+
+"""
+    
+    # Keep style choice in FSM data until the survey is saved, retire the style buttons
+    # and move to color preference question
+    await asyncio.gather(
+        state.update_data(preferred_style=style, style_description=STYLE_DESCRIPTIONS[idx]),
+        callback_query.answer().emit(callback_query.bot),
+        callback_query.message.edit_reply_markup(reply_markup=None).emit(callback_query.bot),
+        ask_color_preference(callback_query.message, state, prefix=confirm_text),
+    )
+
+@router.callback_query(StyleCallback.filter())
+async def handle_stale_style_choice(callback_query: types.CallbackQuery):
+    """Ignore taps on style buttons once the survey has moved past the style question."""
+    await callback_query.answer()
+
+async def ask_color_preference(message: Message, state: FSMContext, prefix: str = ""):
+    """Ask for color preference, optionally preceded by the style confirmation."""
+    await send_survey_request(message, COLOR_QUESTION_REQUEST, prefix)
+    await state.set_state(DesignSurveyStates.waiting_color_preference)
+
+async def ask_material_preference(message: Message, state: FSMContext):
+    """Ask for material preference."""
+    await send_survey_request(message, MATERIAL_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_material_preference)
+
+async def ask_space_type(message: Message, state: FSMContext):
+    """Ask for space type preference."""
+    await send_survey_request(message, SPACE_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_space_type)
+
+async def ask_room_preference(message: Message, state: FSMContext):
+    """Ask for room preference."""
+    await send_survey_request(message, ROOM_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_room_preference)
+
+async def ask_layout_style(message: Message, state: FSMContext):
+    """Ask for layout style preference."""
+    await send_survey_request(message, LAYOUT_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_layout_style)
+
+async def ask_functionality(message: Message, state: FSMContext):
+    """Ask for functionality preferences."""
+    await send_survey_request(message, FUNCTIONALITY_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_functionality)
+
+async def ask_lighting_preference(message: Message, state: FSMContext):
+    """Ask for lighting preference."""
+    await send_survey_request(message, LIGHTING_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_lighting_preference)
+
+async def ask_storage_preference(message: Message, state: FSMContext):
+    """Ask for storage preference."""
+    await send_survey_request(message, STORAGE_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_storage_preference)
+
+async def ask_budget_range(message: Message, state: FSMContext):
+    """Ask for budget range."""
+    await send_survey_request(message, BUDGET_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_budget_range)
+
+async def ask_timeline(message: Message, state: FSMContext):
+    """Ask for project timeline."""
+    await send_survey_request(message, TIMELINE_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_timeline)
+
+async def ask_priority(message: Message, state: FSMContext):
+    """Ask for project priorities."""
+    await send_survey_request(message, PRIORITY_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_priority)
+
+async def ask_lifestyle(message: Message, state: FSMContext):
+    """Ask for lifestyle preferences."""
+    await send_survey_request(message, LIFESTYLE_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_lifestyle)
+
+async def ask_family_needs(message: Message, state: FSMContext):
+    """Ask for family needs."""
+    await send_survey_request(message, FAMILY_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_family_needs)
+
+async def ask_personal_touch(message: Message, state: FSMContext):
+    """Ask for personal touch preferences."""
+    await send_survey_request(message, PERSONAL_QUESTION_REQUEST)
+    await state.set_state(DesignSurveyStates.waiting_personal_touch)
+
+async def handle_survey_answer(message: Message, state: FSMContext, field: str, ask_next):
+    """Keep a free-text survey answer in FSM data and ask the next question."""
+    await state.update_data({field: message.text})
+    
+    await ask_next(message, state)
+
+# Free-text survey steps: (state, session field, next question)
+SURVEY_STEPS = (
+    (DesignSurveyStates.waiting_color_preference, 'color_preference', ask_material_preference),
+    (DesignSurveyStates.waiting_material_preference, 'material_preference', ask_space_type),
+    (DesignSurveyStates.waiting_space_type, 'space_type', ask_room_preference),
+    (DesignSurveyStates.waiting_room_preference, 'room_preference', ask_layout_style),
+    (DesignSurveyStates.waiting_layout_style, 'layout_style', ask_functionality),
+    (DesignSurveyStates.waiting_functionality, 'functionality_preference', ask_lighting_preference),
+    (DesignSurveyStates.waiting_lighting_preference, 'lighting_preference', ask_storage_preference),
+    (DesignSurveyStates.waiting_storage_preference, 'storage_preference', ask_budget_range),
+    (DesignSurveyStates.waiting_budget_range, 'budget_range', ask_timeline),
+    (DesignSurveyStates.waiting_timeline, 'timeline', ask_priority),
+    (DesignSurveyStates.waiting_priority, 'project_priority', ask_lifestyle),
+    (DesignSurveyStates.waiting_lifestyle, 'lifestyle', ask_family_needs),
+    (DesignSurveyStates.waiting_family_needs, 'family_needs', ask_personal_touch),
+)
+
+# Step lookup by the raw FSM state string
+SURVEY_STEPS_BY_STATE = {survey_state.state: (field, ask_next) for survey_state, field, ask_next in SURVEY_STEPS}
+
+# Free-text answer fields in the order they are asked
+SURVEY_ANSWER_FIELDS = tuple(field for _, field, _ in SURVEY_STEPS) + ('personal_touch',)
+
+@router.message(StateFilter(*(survey_state for survey_state, _, _ in SURVEY_STEPS)))
+async def handle_survey_step(message: Message, state: FSMContext, raw_state: str):
+    """Route a free-text answer to the survey step of the current state."""
+    field, ask_next = SURVEY_STEPS_BY_STATE[raw_state]
+    await handle_survey_answer(message, state, field, ask_next)
+
+@router.message(DesignSurveyStates.waiting_personal_touch)
+async def handle_personal_touch(message: Message, state: FSMContext, user_id: int, db: DatabaseService):
+    """Handle personal touch response and complete survey."""
+    await state.update_data(personal_touch=message.text)
+    
+    # Complete survey
+    await complete_design_survey(message, state, user_id, db)
+
+def get_survey_history(answers: Dict[str, Any]) -> List[tuple]:
+    """Rebuild the user's survey replies as (message, sender) pairs, in the order they were given."""
+    history = []
+    if answers.get('preferred_style') in STYLE_KEYS:
+        history.append((f"Выбран стиль: {STYLE_NAMES[STYLE_KEYS.index(answers['preferred_style'])]}", "user"))
+    history.extend((answers[field], "user") for field in SURVEY_ANSWER_FIELDS if field in answers)
+    return history
+
+async def complete_design_survey(message: Message, state: FSMContext, user_id: int, db: DatabaseService):
+    """Complete the design survey and show professional summary."""
+    # Survey answers were collected in FSM data during the survey
+    answers = await state.get_data()
+    
+    # Create professional summary
+    summary = SUMMARY_TEMPLATE.format_map(
+        defaultdict(lambda: 'Не указано', {key: escape(str(value)) for key, value in answers.items()})
+    )
+    
+    # Answers and completion flags are written before the state is cleared, so the next message and
+    # /restart already see the finished survey; only the survey history goes to the background writer
+    await db.update_user_session(user_id, {**answers, 'survey_completed': True, 'in_survey_mode': False})
+    db.persist_turn_in_background(user_id, {}, [*get_survey_history(answers), (summary, "bot")])
+    
+    # Send summary and clear state together; emit() turns the API method into a coroutine for gather
+    await asyncio.gather(message.answer(summary).emit(message.bot), state.clear())
+    
+    logger.info("User %s completed the professional design survey", user_id)
+
+@router.message(Command("survey"))
+async def start_survey_english(message: Message, state: FSMContext, user_id: int, db: DatabaseService):
+    """Start survey in English."""
+    # Clear any existing state, set survey mode flag in database and show survey introduction in English together
+    await asyncio.gather(
+        state.clear(),
+        db.update_user_field(user_id, 'in_survey_mode', True),
+        send_survey_request(message, SURVEY_INTRO_REQUEST_EN),
+    )
+    await ask_style_preference(message, state)
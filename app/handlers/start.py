@@ -3,7 +3,9 @@ Start Command Handler for Professional Interior Design AI Assistant Bot
 Handles the /start command and initial greeting
 """
 
+import asyncio
 import logging
+from html import escape
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.types import Message
@@ -13,71 +15,77 @@ from app.services.database import DatabaseService
 logger = logging.getLogger(__name__)
 router = Router()
 
-@router.message(Command("start"))
-async def start_command(message: Message):
-    """Handle /start command with professional greeting."""
-    try:
-        user = message.from_user
-        db_service = DatabaseService()
-        
-        # Get or create user session
-        user_session = db_service.get_user_session(user.id)
-        
-        # Check if user has completed the survey
-        survey_completed = user_session.get('survey_completed', False)
-        
-        if survey_completed:
-            # User has completed survey - show personalized welcome
-            welcome_text = f"""🏗️ **Добро пожаловать, {user.first_name}!**
+# Welcome texts in HTML, built once and filled with the user's escaped first name
+WELCOME_BACK_TEMPLATE = """🏗️ <b>Добро пожаловать, {first_name}!</b>
 
 Я - ваш персональный профессиональный архитектор и дизайнер интерьеров с 20+ летним опытом работы в проектах премиум-класса.
 
-✅ **Ваш дизайнерский профиль готов!**
+✅ <b>Ваш дизайнерский профиль готов!</b>
 Теперь я знаю ваши предпочтения и могу давать профессиональные советы по дизайну интерьера.
 
-🚀 **Что я могу для вас сделать:**
+🚀 <b>Что я могу для вас сделать:</b>
 • Дать профессиональные советы по планировке
 • Проанализировать фотографии интерьеров
 • Рекомендовать материалы и цветовые решения
 • Помочь с выбором мебели и декора
 • Ответить на любые вопросы по дизайну
 
-💡 **Просто напишите ваш вопрос или отправьте фото интерьера!**
+💡 <b>Просто напишите ваш вопрос или отправьте фото интерьера!</b>
 
 📊 Посмотреть ваш профиль: /status
 🔄 Сбросить данные: /restart
 ❓ Справка: /help"""
-        else:
-            # User hasn't completed survey - encourage to take it
-            welcome_text = f"""🏗️ **Добро пожаловать, {user.first_name}!**
+
+WELCOME_NEW_TEMPLATE = """🏗️ <b>Добро пожаловать, {first_name}!</b>
 
 Я - ваш персональный профессиональный архитектор и дизайнер интерьеров с 20+ летним опытом работы.
 
-🎨 **Мои профессиональные возможности:**
+🎨 <b>Мои профессиональные возможности:</b>
 • Анализ интерьеров и архитектуры
 • Консультации по планировке и дизайну
 • Рекомендации по материалам и цветам
 • Советы по функциональности пространства
 • Ответы на любые вопросы по дизайну
 
-💡 **Для получения персонализированных советов рекомендую пройти тест по дизайну интерьера.**
+💡 <b>Для получения персонализированных советов рекомендую пройти тест по дизайну интерьера.</b>
 
-📊 **Тест включает 15 вопросов:**
+📊 <b>Тест включает 15 вопросов:</b>
 • Стилевые предпочтения
 • Пространственные решения  
 • Функциональность
 • Бюджет и время
 • Образ жизни
 
-🚀 **Начать тест:** /test
-📖 **Справка:** /help
+🚀 <b>Начать тест:</b> /test
+📖 <b>Справка:</b> /help
 
-**Просто напишите ваш вопрос или отправьте фото интерьера для профессионального анализа!**"""
+<b>Просто напишите ваш вопрос или отправьте фото интерьера для профессионального анализа!</b>"""
+
+@router.message(Command("start"))
+async def start_command(message: Message, db: DatabaseService):
+    """Handle /start command with professional greeting."""
+    try:
+        user = message.from_user
+        
+        # Get or create user session
+        user_session = await db.get_user_session(user.id)
         
-        await message.answer(welcome_text, parse_mode="Markdown")
+        # Check if user has completed the survey
+        survey_completed = user_session.get('survey_completed', False)
+        
+        if survey_completed:
+            # User has completed survey - show personalized welcome
+            welcome_text = WELCOME_BACK_TEMPLATE.format(first_name=escape(user.first_name))
+        else:
+            # User hasn't completed survey - encourage to take it
+            welcome_text = WELCOME_NEW_TEMPLATE.format(first_name=escape(user.first_name))
         
-        # Store welcome message in conversation history
-        db_service.add_conversation_message(user.id, welcome_text, "bot")
+        # Send welcome message and store it in conversation history together;
+        # emit() turns the API method into a coroutine for gather
+        await asyncio.gather(
+            message.answer(welcome_text).emit(message.bot),
+            db.add_conversation_message(user.id, welcome_text, "bot"),
+        )
         
         logger.info(f"User {user.id} started the bot")
         
@@ -0,0 +1,8 @@
+"""
+Middlewares package for AI Assistant Bot
+"""
+
+from .user_id import UserIdMiddleware
+from .rate_limit import SendRateLimitMiddleware
+
+__all__ = ['UserIdMiddleware', 'SendRateLimitMiddleware']
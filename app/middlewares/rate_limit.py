@@ -0,0 +1,38 @@
+"""
+Send Rate Limit Middleware for AI Assistant Bot
+Keeps outgoing messages under Telegram's flood limit for the whole bot
+"""
+
+import asyncio
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+class SendRateLimitMiddleware(BaseRequestMiddleware):
+    """Delay send* API calls so that at most `rate` of them start per `period` seconds.
+
+    Works as a token bucket of `rate` tokens: a burst of up to `rate` messages goes out
+    at once, later ones are spaced evenly. Other API calls are not delayed.
+    """
+
+    def __init__(self, rate: int, period: float = 1.0):
+        self.interval = period / rate
+        self.burst_tolerance = period - self.interval
+        # Theoretical arrival time of the next message, in event loop time
+        self._next_send_at = 0.0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if method.__api_method__.startswith('send'):
+            now = asyncio.get_running_loop().time()
+            send_at = max(self._next_send_at, now)
+            self._next_send_at = send_at + self.interval
+            delay = send_at - now - self.burst_tolerance
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return await make_request(bot, method)
@@ -0,0 +1,23 @@
+"""
+User ID Middleware for AI Assistant Bot
+Injects the Telegram user ID into handlers as `user_id`
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+class UserIdMiddleware(BaseMiddleware):
+    """Pass the sender's ID to handlers, so they do not look it up on the event themselves."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # aiogram resolves the sender once per update as event_from_user
+        user = data.get('event_from_user')
+        if user is not None:
+            data['user_id'] = user.id
+        return await handler(event, data)
@@ -5,16 +5,42 @@ Natural conversation flow with AI assistant
 
 import logging
 import random
+import re
 from typing import Dict, Any
+from cachetools import TTLCache
+from app.services.localization import contains_russian
 
 logger = logging.getLogger(__name__)
 
+# Users remembered as greeted, and for how many seconds
+GREETED_USERS_LIMIT = 100_000
+GREETING_TTL = 86400
+
+# Interest keywords, matched case-insensitively in one regex scan each
+PHOTO_INTEREST_RE = re.compile(r'фото|photo|изображение|image', re.IGNORECASE)
+SURVEY_INTEREST_RE = re.compile(r'тест|test|опрос|survey', re.IGNORECASE)
+
+# First-interaction greetings, one is picked at random
+RU_GREETINGS = (
+    "Привет! Я ваш ИИ ассистент. Как я могу вам помочь?",
+    "Здравствуйте! Я готов ответить на ваши вопросы. Что вас интересует?",
+    "Привет! Я здесь, чтобы помочь. Расскажите, что вам нужно?",
+    "Здравствуйте! Чем могу быть полезен сегодня?"
+)
+
+EN_GREETINGS = (
+    "Hello! I'm your AI assistant. How can I help you?",
+    "Hi there! I'm ready to answer your questions. What would you like to know?",
+    "Hello! I'm here to help. What do you need assistance with?",
+    "Hi! How can I be of service today?"
+)
+
 class ConversationService:
     """Handles natural conversation flow with users."""
     
     def __init__(self):
         """Initialize conversation service."""
-        self.greeting_sent = set()  # Track users who got greeting
+        self.greeting_sent = TTLCache(maxsize=GREETED_USERS_LIMIT, ttl=GREETING_TTL)  # Track users who got greeting
         
     async def handle_message(self, user_id: int, user_input: str, user_session: Dict[str, Any]) -> str:
         """Handle user message and return appropriate response."""
@@ -23,7 +49,7 @@ class ConversationService:
         is_first_time = user_id not in self.greeting_sent
         
         if is_first_time:
-            self.greeting_sent.add(user_id)
+            self.greeting_sent[user_id] = True
             return await self._handle_first_interaction(user_input, user_session)
         
         # Continue conversation
@@ -33,22 +59,8 @@ class ConversationService:
         """Handle first user interaction."""
         
         # Detect language and respond accordingly
-        if self._is_russian(user_input):
-            greetings = [
-                "Привет! Я ваш ИИ ассистент. Как я могу вам помочь?",
-                "Здравствуйте! Я готов ответить на ваши вопросы. Что вас интересует?",
-                "Привет! Я здесь, чтобы помочь. Расскажите, что вам нужно?",
-                "Здравствуйте! Чем могу быть полезен сегодня?"
-            ]
-        else:
-            greetings = [
-                "Hello! I'm your AI assistant. How can I help you?",
-                "Hi there! I'm ready to answer your questions. What would you like to know?",
-                "Hello! I'm here to help. What do you need assistance with?",
-                "Hi! How can I be of service today?"
-            ]
-        
-        return random.choice(greetings)
+        greetings = RU_GREETINGS if self._is_russian(user_input) else EN_GREETINGS
+        return greetings[random.randrange(len(greetings))]
     
     async def _handle_ongoing_conversation(self, user_input: str, session: Dict[str, Any]) -> str:
         """Handle ongoing conversation."""
@@ -74,23 +86,18 @@ class ConversationService:
         else:
             extracted['language'] = 'english'
         
-        # Extract any mentioned preferences or context
-        user_input_lower = user_input.lower()
-        
-        # Simple keyword extraction
-        if any(word in user_input_lower for word in ['фото', 'photo', 'изображение', 'image']):
+        # Simple keyword extraction of mentioned preferences or context
+        if PHOTO_INTEREST_RE.search(user_input):
             extracted['photo_interest'] = True
         
-        if any(word in user_input_lower for word in ['тест', 'test', 'опрос', 'survey']):
+        if SURVEY_INTEREST_RE.search(user_input):
             extracted['survey_interest'] = True
         
         return extracted
     
     def _is_russian(self, text: str) -> bool:
         """Check if text contains Russian characters."""
-        russian_chars = set('абвгдеёжзийклмнопрстуфхцчшщъыьэюя')
-        text_chars = set(text.lower())
-        return bool(text_chars.intersection(russian_chars))
+        return contains_russian(text)
     
     def should_suggest_survey(self, user_session: Dict[str, Any]) -> bool:
         """Determine if we should suggest taking a survey."""
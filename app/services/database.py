@@ -4,129 +4,299 @@ Handles JSON file operations for user sessions and conversations
 """
 
 import logging
-import json
-from typing import Dict, Any, Optional, List
+import asyncio
+import threading
+import ijson
+import orjson
+from collections import deque
+from itertools import islice
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Iterable
 from datetime import datetime
 import os
-from config import DATA_DIR, USER_DATA_FILE, CONVERSATION_DATA_FILE
+from config import (
+    DATA_DIR, USER_DATA_FILE, CONVERSATION_DATA_FILE,
+    USER_DATA_DIR, CONVERSATION_DATA_DIR, MEDIA_GROUP_TTL,
+    SESSION_CACHE_SIZE, SESSION_CACHE_TTL
+)
 
 logger = logging.getLogger(__name__)
 
+# Dedicated threads for heavy JSON file work, so it does not stall the event loop
+_io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='json-io')
+
+# Serializes read-modify-write cycles on the JSON files across the IO threads
+_io_lock = threading.Lock()
+
+# Guards the session and history caches; held only for a lookup or store, never during file IO
+_cache_lock = threading.Lock()
+
+# Keep only last 50 messages per user
+MAX_CONVERSATION_MESSAGES = 50
+
+# A history file is compacted once it holds this many lines
+MAX_HISTORY_FILE_LINES = 2 * MAX_CONVERSATION_MESSAGES
+
+# Background write queue: capacity, turns written per batch, and seconds to collect a burst
+MAX_QUEUED_WRITES = 10_000
+WRITE_BATCH_SIZE = 100
+WRITE_DEBOUNCE_DELAY = 0.2
+
 class DatabaseService:
-    """Database service for managing user sessions and conversations."""
+    """Database service for managing user sessions and conversations.
+    
+    Every user is stored in its own small file, so a write touches one user only:
+        data/users/{id}.json          user session
+        data/conversations/{id}.jsonl conversation messages, one per line, appended to
+    """
     
     def __init__(self):
         """Initialize database service."""
+        self.users_dir = USER_DATA_DIR
+        self.conversations_dir = CONVERSATION_DATA_DIR
+        self._seen_media_groups = TTLCache(maxsize=10_000, ttl=MEDIA_GROUP_TTL)
+        # Write-through copy of recently used sessions, guarded by _cache_lock
+        self._session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+        # Recent histories as (deque of the last 50 messages, lines in the file), guarded by _cache_lock;
+        # a cached deque is replaced on append, never changed in place
+        self._history_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+        self._init_background_writes()
         self._ensure_data_directory()
-        self.users_file = USER_DATA_FILE
-        self.conversations_file = CONVERSATION_DATA_FILE
+    
+    def _init_background_writes(self):
+        """Set up the queue of background writes; its writer task starts with the first queued turn."""
+        self._write_queue = asyncio.Queue(maxsize=MAX_QUEUED_WRITES)
+        self._flush_requested = asyncio.Event()
+        self._writer_task = None
     
     def _ensure_data_directory(self):
-        """Ensure data directory exists."""
+        """Ensure data directories exist, splitting legacy single-file data on first run."""
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
             logger.info(f"Created data directory: {DATA_DIR}")
+        
+        if not os.path.isdir(self.users_dir):
+            os.makedirs(self.users_dir)
+            self._migrate_legacy_file(
+                USER_DATA_FILE, lambda user_id, session: self._write_json(self._user_path(user_id), session)
+            )
+        
+        if not os.path.isdir(self.conversations_dir):
+            os.makedirs(self.conversations_dir)
+            self._migrate_legacy_file(CONVERSATION_DATA_FILE, self._write_history)
     
-    def _load_users_data(self) -> Dict[str, Any]:
-        """Load users data from JSON file."""
+    def _migrate_legacy_file(self, legacy_file: str, write_user):
+        """Copy every user from a legacy {user_id: data} JSON file into its own file."""
+        migrated = 0
+        for user_id_str, user_data in self._iter_json_items(legacy_file):
+            write_user(user_id_str, user_data)
+            migrated += 1
+        if migrated:
+            logger.info(f"Migrated {migrated} users from {legacy_file}")
+    
+    def _user_path(self, user_id) -> str:
+        return os.path.join(self.users_dir, f"{user_id}.json")
+    
+    def _conversation_path(self, user_id) -> str:
+        return os.path.join(self.conversations_dir, f"{user_id}.jsonl")
+    
+    def _legacy_conversation_path(self, user_id) -> str:
+        return os.path.join(self.conversations_dir, f"{user_id}.json")
+    
+    def _read_json(self, path: str, default: Any = None) -> Any:
+        """Read a JSON file with orjson, returning default if it is missing or broken."""
         try:
-            if os.path.exists(self.users_file):
-                with open(self.users_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                return {}
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading users data: {e}")
-            return {}
+            with open(path, 'rb') as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return default
+        except (orjson.JSONDecodeError, IOError) as e:
+            logger.error(f"Error loading {path}: {e}")
+            return default
     
-    def _save_users_data(self, data: Dict[str, Any]) -> bool:
-        """Save users data to JSON file."""
+    def _iter_json_items(self, path: str):
+        """Stream the (user_id, data) pairs of a large {user_id: data} JSON file, parsing one user at a time."""
         try:
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                yield from ijson.kvitems(f, '', use_float=True)
+        except FileNotFoundError:
+            return
+        except (ijson.JSONError, IOError) as e:
+            logger.error(f"Error loading {path}: {e}")
+    
+    def _write_json(self, path: str, data: Any) -> bool:
+        """Write a JSON file with orjson, replacing the old file atomically."""
+        try:
+            payload = orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
             return True
-        except IOError as e:
-            logger.error(f"Error saving users data: {e}")
+        except (TypeError, IOError) as e:
+            logger.error(f"Error saving {path}: {e}")
             return False
     
-    def _load_conversations_data(self) -> Dict[str, Any]:
-        """Load conversations data from JSON file."""
+    def _read_history(self, user_id) -> tuple:
+        """Stream a history file line by line into a bounded deque, converting a legacy JSON list on the way."""
+        history = deque(maxlen=MAX_CONVERSATION_MESSAGES)
+        lines = 0
         try:
-            if os.path.exists(self.conversations_file):
-                with open(self.conversations_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                return {}
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Error loading conversations data: {e}")
-            return {}
+            with open(self._conversation_path(user_id), 'rb') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        history.append(orjson.loads(line))
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"Skipping broken history line of user {user_id}")
+            return history, lines
+        except FileNotFoundError:
+            pass
+        except IOError as e:
+            logger.error(f"Error loading history of user {user_id}: {e}")
+            return history, lines
+        
+        legacy_path = self._legacy_conversation_path(user_id)
+        legacy_history = self._read_json(legacy_path, [])
+        if legacy_history and self._write_history(user_id, legacy_history):
+            os.remove(legacy_path)
+        history.extend(legacy_history)
+        return history, len(history)
     
-    def _save_conversations_data(self, data: Dict[str, Any]) -> bool:
-        """Save conversations data to JSON file."""
+    def _write_history(self, user_id, history: Iterable[Dict[str, Any]]) -> bool:
+        """Rewrite a history file with the last 50 messages, replacing the old file atomically."""
         try:
-            with open(self.conversations_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+            entries = list(history)[-MAX_CONVERSATION_MESSAGES:]
+            path = self._conversation_path(user_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.writelines(orjson.dumps(entry, default=str) + b"\n" for entry in entries)
+            os.replace(tmp_path, path)
             return True
-        except IOError as e:
-            logger.error(f"Error saving conversations data: {e}")
+        except (TypeError, IOError) as e:
+            logger.error(f"Error saving history of user {user_id}: {e}")
             return False
     
-    def get_user_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+    def _cached_history(self, user_id: int) -> tuple:
+        """Return the (history, lines) pair of a user, reading the file on a cache miss; call with _io_lock held."""
+        with _cache_lock:
+            entry = self._history_cache.get(user_id)
+        if entry is None:
+            entry = self._read_history(user_id)
+            with _cache_lock:
+                self._history_cache[user_id] = entry
+        return entry
+    
+    async def _run_io(self, func, *args):
+        """Run a blocking file operation on the JSON IO executor."""
+        return await asyncio.get_running_loop().run_in_executor(_io_executor, func, *args)
+    
+    async def get_user_session(self, user_id: int) -> Optional[Dict[str, Any]]:
         """
-        Get user session data by user ID.
+        Get user session data by user ID, served from memory when it was read or written recently.
         
         Args:
             user_id: Telegram user ID
-            
+        
         Returns:
             User session data or None if not found
         """
+        with _cache_lock:
+            session = self._session_cache.get(user_id)
+        if session is not None:
+            return dict(session)
+        
         try:
-            users_data = self._load_users_data()
-            user_id_str = str(user_id)
-            
-            if user_id_str in users_data:
-                return users_data[user_id_str]
-            else:
-                # Create new user session
-                new_session = self._create_default_user_session(user_id)
-                users_data[user_id_str] = new_session
-                self._save_users_data(users_data)
-                return new_session
-                
+            return await self._run_io(self._get_user_session_sync, user_id)
+        
         except Exception as e:
             logger.error(f"Error getting user session: {e}")
             return None
     
-    def update_user_session(self, user_id: int, data: Dict[str, Any]) -> bool:
+    def _get_user_session_sync(self, user_id: int) -> Dict[str, Any]:
+        """Blocking part of get_user_session, run on the JSON IO executor."""
+        with _io_lock:
+            session = self._read_json(self._user_path(user_id))
+            if session is None:
+                # Create new user session; the write is lazy, the file appears with the first field update
+                session = self._create_default_user_session(user_id)
+            with _cache_lock:
+                self._session_cache[user_id] = dict(session)
+            return session
+    
+    async def has_any_field(self, user_id: int, fields: Iterable[str]) -> bool:
+        """
+        Check whether any of the given session fields holds a non-empty value.
+        
+        Args:
+            user_id: Telegram user ID
+            fields: Field names to check
+        
+        Returns:
+            True if at least one field is set, False otherwise
+        """
+        try:
+            session = await self._run_io(self._read_json, self._user_path(user_id), {})
+            return any(session.get(field) for field in fields)
+        
+        except Exception as e:
+            logger.error(f"Error checking user fields: {e}")
+            return False
+    
+    async def update_user_session(self, user_id: int, data: Dict[str, Any]) -> bool:
         """
         Update user session data.
         
         Args:
             user_id: Telegram user ID
             data: Updated session data
-            
+        
         Returns:
             True if successful, False otherwise
         """
         try:
-            users_data = self._load_users_data()
-            user_id_str = str(user_id)
-            
-            if user_id_str not in users_data:
-                users_data[user_id_str] = self._create_default_user_session(user_id)
-            
-            # Update existing data
-            users_data[user_id_str].update(data)
-            users_data[user_id_str]['updated_at'] = datetime.now().isoformat()
-            
-            return self._save_users_data(users_data)
-            
+            return await self._run_io(self._update_user_session_sync, user_id, data)
+        
         except Exception as e:
             logger.error(f"Error updating user session: {e}")
             return False
     
-    def update_user_field(self, user_id: int, field: str, value: Any) -> bool:
+    def _update_user_session_sync(self, user_id: int, data: Dict[str, Any]) -> bool:
+        """Blocking part of update_user_session, run on the JSON IO executor."""
+        with _io_lock:
+            session = self._read_json(self._user_path(user_id)) or self._create_default_user_session(user_id)
+            
+            # Update existing data
+            session.update(data)
+            session['updated_at'] = datetime.now().isoformat()
+            
+            saved = self._write_json(self._user_path(user_id), session)
+            with _cache_lock:
+                if saved:
+                    self._session_cache[user_id] = session
+                else:
+                    self._session_cache.pop(user_id, None)
+            return saved
+    
+    async def update_user_fields(self, user_id: int, fields: Dict[str, Any]) -> bool:
+        """
+        Update several user fields in a single write.
+        
+        Args:
+            user_id: Telegram user ID
+            fields: Mapping of field names to new values
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        if not fields:
+            return True
+        return await self.update_user_session(user_id, fields)
+    
+    async def update_user_field(self, user_id: int, field: str, value: Any) -> bool:
         """
         Update specific user field.
         
@@ -134,27 +304,18 @@ class DatabaseService:
             user_id: Telegram user ID
             field: Field name to update
             value: New field value
-            
+        
         Returns:
             True if successful, False otherwise
         """
         try:
-            users_data = self._load_users_data()
-            user_id_str = str(user_id)
-            
-            if user_id_str not in users_data:
-                users_data[user_id_str] = self._create_default_user_session(user_id)
-            
-            users_data[user_id_str][field] = value
-            users_data[user_id_str]['updated_at'] = datetime.now().isoformat()
-            
-            return self._save_users_data(users_data)
-            
+            return await self.update_user_session(user_id, {field: value})
+        
         except Exception as e:
             logger.error(f"Error updating user field: {e}")
             return False
     
-    def add_conversation_message(self, user_id: int, message: str, sender: str) -> bool:
+    async def add_conversation_message(self, user_id: int, message: str, sender: str) -> bool:
         """
         Add a conversation message to the database.
         
@@ -162,59 +323,249 @@ class DatabaseService:
             user_id: Telegram user ID
             message: Message content
             sender: 'user' or 'bot'
-            
+        
         Returns:
             True if successful, False otherwise
         """
         try:
-            conversations_data = self._load_conversations_data()
-            user_id_str = str(user_id)
-            
-            if user_id_str not in conversations_data:
-                conversations_data[user_id_str] = []
-            
-            message_data = {
-                'message': message,
-                'sender': sender,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            conversations_data[user_id_str].append(message_data)
+            return await self._run_io(self._append_messages_sync, user_id, [(message, sender)])
+        
+        except Exception as e:
+            logger.error(f"Error adding conversation message: {e}")
+            return False
+    
+    def _append_messages_sync(self, user_id: int, messages: List[tuple]) -> bool:
+        """Append (message, sender) pairs to the user's history file, compacting it to the last 50 when it grows."""
+        timestamp = datetime.now().isoformat()
+        entries = [
+            {'message': message, 'sender': sender, 'timestamp': timestamp}
+            for message, sender in messages
+        ]
+        with _io_lock:
+            cached, lines = self._cached_history(user_id)
+            # Extend a copy, so the loop can read the cached deque without taking _io_lock
+            history = deque(cached, maxlen=MAX_CONVERSATION_MESSAGES)
+            history.extend(entries)
             
-            # Keep only last 50 messages per user
-            if len(conversations_data[user_id_str]) > 50:
-                conversations_data[user_id_str] = conversations_data[user_id_str][-50:]
+            if lines + len(entries) > MAX_HISTORY_FILE_LINES:
+                saved = self._write_history(user_id, history)
+                lines = len(history)
+            else:
+                try:
+                    with open(self._conversation_path(user_id), 'ab') as f:
+                        f.writelines(orjson.dumps(entry, default=str) + b"\n" for entry in entries)
+                    saved = True
+                except (TypeError, IOError) as e:
+                    logger.error(f"Error saving history of user {user_id}: {e}")
+                    saved = False
+                lines += len(entries)
             
-            return self._save_conversations_data(conversations_data)
+            with _cache_lock:
+                if saved:
+                    self._history_cache[user_id] = (history, lines)
+                else:
+                    self._history_cache.pop(user_id, None)
+            return saved
+    
+    async def persist_turn(self, user_id: int, fields: Dict[str, Any], messages: List[tuple]) -> bool:
+        """
+        Save the session changes and conversation messages of one dialog turn.
+        
+        Args:
+            user_id: Telegram user ID
+            fields: Changed session fields, may be empty
+            messages: (message, sender) pairs in the order they happened
+        
+        Returns:
+            True if everything was saved, False otherwise
+        """
+        try:
+            return await self._run_io(self._persist_turn_sync, user_id, fields, messages)
+        
+        except Exception as e:
+            logger.error(f"Error persisting dialog turn: {e}")
+            return False
+    
+    def _persist_turn_sync(self, user_id: int, fields: Dict[str, Any], messages: List[tuple]) -> bool:
+        """Blocking part of persist_turn, run on the JSON IO executor."""
+        success = self._update_user_session_sync(user_id, fields) if fields else True
+        if messages:
+            success = self._append_messages_sync(user_id, messages) and success
+        return success
+    
+    async def persist_turns(self, turns: List[tuple]) -> bool:
+        """
+        Save several dialog turns in one IO job, merging the turns of the same user.
+        
+        Args:
+            turns: (user_id, fields, messages) tuples in the order they happened
+        
+        Returns:
+            True if everything was saved, False otherwise
+        """
+        try:
+            return await self._run_io(self._persist_turns_sync, turns)
             
         except Exception as e:
-            logger.error(f"Error adding conversation message: {e}")
+            logger.error(f"Error persisting dialog turns: {e}")
             return False
     
-    def get_conversation_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    def _persist_turns_sync(self, turns: List[tuple]) -> bool:
+        """Blocking part of persist_turns, run on the JSON IO executor."""
+        merged = {}
+        for user_id, fields, messages in turns:
+            user_fields, user_messages = merged.setdefault(user_id, ({}, []))
+            user_fields.update(fields)
+            user_messages.extend(messages)
+        
+        success = True
+        for user_id, (fields, messages) in merged.items():
+            success = self._persist_turn_sync(user_id, fields, messages) and success
+        return success
+    
+    def persist_turn_in_background(self, user_id: int, fields: Dict[str, Any], messages: List[tuple]):
+        """
+        Queue a dialog turn for the background writer, so replies are not delayed by storage IO.
+        
+        Args:
+            user_id: Telegram user ID
+            fields: Changed session fields, may be empty
+            messages: (message, sender) pairs in the order they happened
+        """
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._run_writer())
+        try:
+            self._write_queue.put_nowait((user_id, fields, messages))
+        except asyncio.QueueFull:
+            logger.error(f"Write queue is full, dropping dialog turn of user {user_id}")
+    
+    async def _run_writer(self):
+        """Drain the write queue in batches of up to WRITE_BATCH_SIZE turns, waiting a moment for bursts to pile up."""
+        while True:
+            batch = [await self._write_queue.get()]
+            if not self._flush_requested.is_set():
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=WRITE_DEBOUNCE_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            try:
+                await self.persist_turns(batch)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+            if self._write_queue.empty():
+                self._flush_requested.clear()
+    
+    async def flush(self):
+        """Wait until every queued background write is saved, skipping the debounce delay."""
+        if self._writer_task is not None:
+            self._flush_requested.set()
+            await self._write_queue.join()
+    
+    async def get_conversation_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """
         Get conversation history for a user.
         
         Args:
             user_id: Telegram user ID
             limit: Maximum number of messages to return
-            
+        
         Returns:
             List of conversation messages
         """
+        with _cache_lock:
+            entry = self._history_cache.get(user_id)
+        if entry is not None:
+            return self._history_tail(entry[0], limit)
+        
         try:
-            conversations_data = self._load_conversations_data()
-            user_id_str = str(user_id)
-            
-            if user_id_str in conversations_data:
-                return conversations_data[user_id_str][-limit:]
-            else:
-                return []
-                
+            return await self._run_io(self._get_conversation_history_sync, user_id, limit)
+        
         except Exception as e:
             logger.error(f"Error getting conversation history: {e}")
             return []
     
+    def _get_conversation_history_sync(self, user_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Blocking part of get_conversation_history, run on the JSON IO executor."""
+        with _io_lock:
+            return self._history_tail(self._cached_history(user_id)[0], limit)
+    
+    @staticmethod
+    def _history_tail(history: deque, limit: int) -> List[Dict[str, Any]]:
+        """Copy the last `limit` messages of the ring buffer, oldest first, without copying the rest."""
+        return list(islice(reversed(history), limit))[::-1]
+    
+    async def reset_user_data(self, user_id: int) -> bool:
+        """
+        Reset all user data and create a fresh session.
+        
+        Args:
+            user_id: Telegram user ID
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            return await self._run_io(self._reset_user_data_sync, user_id)
+        except Exception as e:
+            logger.error(f"Error resetting user data: {e}")
+            return False
+    
+    def _reset_user_data_sync(self, user_id: int) -> bool:
+        """Blocking part of reset_user_data, run on the JSON IO executor."""
+        with _io_lock:
+            # Replace the entire session
+            new_session = self._create_default_user_session(user_id)
+            new_session['pending_confirmation'] = None
+            
+            if not self._write_json(self._user_path(user_id), new_session):
+                with _cache_lock:
+                    self._session_cache.pop(user_id, None)
+                return False
+            with _cache_lock:
+                self._session_cache[user_id] = new_session
+                # Also clear conversation history
+                self._history_cache.pop(user_id, None)
+            for path in (self._conversation_path(user_id), self._legacy_conversation_path(user_id)):
+                try:
+                    os.remove(path)
+                    logger.info(f"Cleared conversation history for user {user_id}")
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not clear conversation history: {e}")
+        
+        logger.info(f"Successfully reset all data for user {user_id}")
+        return True
+    
+    async def claim_media_group(self, media_group_id: str) -> bool:
+        """
+        Mark a media group as handled.
+        
+        Args:
+            media_group_id: Telegram media group ID
+        
+        Returns:
+            True for the first photo of the group, False for the rest
+        """
+        if media_group_id in self._seen_media_groups:
+            return False
+        self._seen_media_groups[media_group_id] = True
+        return True
+    
+    async def close(self):
+        """Finish pending background writes and stop the writer; there is nothing else to release for JSON files."""
+        await self._stop_writer()
+    
+    async def _stop_writer(self):
+        """Flush the write queue and cancel its writer task."""
+        await self.flush()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+    
     def _create_default_user_session(self, user_id: int) -> Dict[str, Any]:
         """Create default user session."""
         return {
@@ -226,4 +577,4 @@ class DatabaseService:
             'preferences': {},
             'in_survey_mode': False,
             'start_option_chosen': None
-        }
\ No newline at end of file
+        }
@@ -4,13 +4,20 @@ Handles language detection and localization
 """
 
 import logging
+import re
 from typing import Dict, Any
 
 logger = logging.getLogger(__name__)
 
-# Language detection patterns
-RUSSIAN_CHARS = set('абвгдеёжзийклмнопрстуфхцчшщъыьэюя')
-ENGLISH_CHARS = set('abcdefghijklmnopqrstuvwxyz')
+# Language detection pattern, scanned by the regex engine instead of per-character Python loops
+RUSSIAN_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+
+# Characters looked at to tell the language; enough for a pasted English name or link before Russian text
+LANGUAGE_SCAN_LIMIT = 256
+
+def contains_russian(text: str) -> bool:
+    """Check if the beginning of the text contains Russian characters."""
+    return RUSSIAN_RE.search(text, 0, LANGUAGE_SCAN_LIMIT) is not None
 
 def get_user_locale(user_id: int) -> str:
     """
@@ -28,7 +35,7 @@ def get_user_locale(user_id: int) -> str:
 
 def detect_language(text: str) -> str:
     """
-    Detect language from text.
+    Detect language from text; the first Russian character decides, so the scan stops there.
     
     Args:
         text: Text to analyze
@@ -36,17 +43,24 @@ def detect_language(text: str) -> str:
     Returns:
         Language code: 'ru' for Russian, 'en' for English
     """
-    if not text:
-        return 'en'
-    
-    text_lower = text.lower()
-    russian_count = sum(1 for char in text_lower if char in RUSSIAN_CHARS)
-    english_count = sum(1 for char in text_lower if char in ENGLISH_CHARS)
-    
-    if russian_count > english_count:
+    if text and contains_russian(text):
         return 'ru'
-    else:
-        return 'en'
+    return 'en'
+
+# Translations keyed by (key, locale), so a lookup is a single hash
+TRANSLATIONS = {
+    ('welcome', 'en'): 'Welcome! I\'m your AI assistant. How can I help you?',
+    ('welcome', 'ru'): 'Добро пожаловать! Я ваш ИИ ассистент. Как я могу вам помочь?',
+    ('photo_analyzed', 'en'): 'Photo analyzed!',
+    ('photo_analyzed', 'ru'): 'Фото проанализировано!',
+    ('survey_suggestion', 'en'): 'For more personalized advice, I recommend taking a short survey. Type "survey" to begin.',
+    ('survey_suggestion', 'ru'): 'Для получения более персонализированных советов, рекомендую пройти короткий тест. Напишите "тест" чтобы начать.',
+    ('error_processing', 'en'): 'I apologize, but I encountered an error processing your request. Please try again.',
+    ('error_processing', 'ru'): 'Извините, но произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте снова.',
+}
+
+# Translations with format placeholders; the rest are returned without formatting
+TEMPLATED_TRANSLATIONS = frozenset(lookup for lookup, text in TRANSLATIONS.items() if '{' in text)
 
 def t(key: str, locale: str = 'en', **kwargs) -> str:
     """
@@ -60,33 +74,14 @@ def t(key: str, locale: str = 'en', **kwargs) -> str:
     Returns:
         Localized text
     """
-    translations = {
-        'welcome': {
-            'en': 'Welcome! I\'m your AI assistant. How can I help you?',
-            'ru': 'Добро пожаловать! Я ваш ИИ ассистент. Как я могу вам помочь?'
-        },
-        'photo_analyzed': {
-            'en': 'Photo analyzed!',
-            'ru': 'Фото проанализировано!'
-        },
-        'survey_suggestion': {
-            'en': 'For more personalized advice, I recommend taking a short survey. Type "survey" to begin.',
-            'ru': 'Для получения более персонализированных советов, рекомендую пройти короткий тест. Напишите "тест" чтобы начать.'
-        },
-        'error_processing': {
-            'en': 'I apologize, but I encountered an error processing your request. Please try again.',
-            'ru': 'Извините, но произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте снова.'
-        }
-    }
-    
-    if key in translations and locale in translations[key]:
-        text = translations[key][locale]
-        if kwargs:
-            try:
-                text = text.format(**kwargs)
-            except KeyError:
-                logger.warning(f"Missing format parameters for key: {key}")
-        return text
+    text = TRANSLATIONS.get((key, locale))
+    if text is None:
+        # Return key if translation not found
+        return key
     
-    # Return key if translation not found
-    return key
+    if kwargs and (key, locale) in TEMPLATED_TRANSLATIONS:
+        try:
+            text = text.format_map(kwargs)
+        except KeyError:
+            logger.warning(f"Missing format parameters for key: {key}")
+    return text
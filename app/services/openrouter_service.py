@@ -3,100 +3,154 @@ OpenRouter AI Service for Professional Interior Design AI Assistant Bot
 Uses OpenRouter API to access AI models for professional design advice
 """
 
-import logging
-import json
 import asyncio
+import base64
+import hashlib
+import logging
 import os
-from typing import Dict, Any, Tuple, Optional, List
-from openai import OpenAI
-from config import OPENROUTER_API_KEY, AI_SYSTEM_PROMPT
+import re
+import orjson
+from typing import Dict, Any, Tuple, Optional, List, Callable, Awaitable
+from cachetools import TTLCache
+from openai import AsyncOpenAI, Timeout
+from config import (
+    OPENROUTER_API_KEY, MAX_RESPONSE_LENGTH, AI_RESPONSE_CACHE_SIZE, AI_RESPONSE_CACHE_TTL,
+    AI_IMAGE_CACHE_SIZE, AI_IMAGE_CACHE_TTL, AI_COMPACT_HISTORY, AI_STREAM_EDIT_INTERVAL,
+    AI_CONNECT_TIMEOUT, AI_REQUEST_TIMEOUT, AI_MAX_RETRIES, AI_TOTAL_TIMEOUT
+)
+from app.services.database import DatabaseService
+from app.services.localization import contains_russian
+from app.services.product_search import ProductSearchService
 
 logger = logging.getLogger(__name__)
 
+# Receives the cleaned answer received so far while a completion is streamed
+PartialResponseCallback = Callable[[str], Awaitable[None]]
+
+TRUNCATION_SUFFIX = "\n\n... (ответ обрезан)"
+
+# Returned when the model call fails; never cached
+AI_ERROR_RESPONSE = "I apologize, but I'm having trouble generating a response right now."
+
+# Words of a question, used to match rephrasings that differ only in case, punctuation or spacing
+QUESTION_WORD_RE = re.compile(r'\w+')
+
+# Markdown the model is asked not to use: **bold**, *italic*, __underlined__ and heading marks,
+# matched in one pass with the emphasized text captured
+MARKUP_RE = re.compile(r'\*\*(?P<bold>.*?)\*\*|\*(?P<italic>.*?)\*|__(?P<underlined>.*?)__|#+\s*')
+EXTRA_BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n')
+
+def strip_markup(match: re.Match) -> str:
+    """Replacement for MARKUP_RE: the emphasized text, or nothing for heading marks."""
+    return match.group('bold') or match.group('italic') or match.group('underlined') or ''
+
+# Words showing interest in personalized advice, any of them anywhere in the message
+SURVEY_KEYWORD_RE = re.compile('|'.join(map(re.escape, (
+    'персональный', 'personal', 'личный', 'personalized', 'совет', 'advice',
+    'рекомендация', 'recommendation', 'дизайн', 'design', 'стиль', 'style'
+))), re.IGNORECASE)
+
+# Appended to answers of users who have not taken the survey yet
+SURVEY_SUGGESTION_RU = "💡 Для получения профессиональных дизайнерских советов, рекомендую пройти специализированный тест по дизайну интерьера. Напишите 'тест' чтобы начать."
+SURVEY_SUGGESTION_EN = "💡 For professional interior design advice, I recommend taking a specialized interior design survey. Type 'survey' to begin."
+
+# Prompt texts kept outside the code, one .txt file per prompt
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompts')
+
+def load_prompt(name: str) -> str:
+    """Read a prompt file without trailing spaces and surplus blank lines."""
+    with open(os.path.join(PROMPTS_DIR, f"{name}.txt"), encoding='utf-8') as f:
+        lines = [line.rstrip() for line in f]
+    return EXTRA_BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip()
+
+# Read once at import and shared by every request
+SYSTEM_PROMPT_RU = load_prompt('system_ru')
+SYSTEM_PROMPT_EN = load_prompt('system_en')
+
+# Photo prompts by (language, whether the caption asks something); {question} is the caption
+IMAGE_PROMPTS = {
+    ("russian", True): load_prompt('image_question_ru'),
+    ("english", True): load_prompt('image_question_en'),
+    ("russian", False): load_prompt('image_analysis_ru'),
+    ("english", False): load_prompt('image_analysis_en'),
+}
+# Caption-only prompts for when the vision model fails
+IMAGE_FALLBACK_PROMPTS = {
+    "russian": load_prompt('image_fallback_ru'),
+    "english": load_prompt('image_fallback_en'),
+}
+
+# Row labels of the compact history table
+HISTORY_ROLE_LABELS = {"user": "U", "assistant": "A"}
+
+def compact_history(context_messages: List[Dict[str, str]]) -> Dict[str, str]:
+    """Fold role-tagged context messages into one system message with a role|text row per turn."""
+    rows = (
+        f"{HISTORY_ROLE_LABELS[msg['role']]}|{' '.join(msg['content'].split())}"
+        for msg in context_messages
+    )
+    return {"role": "system", "content": "history: role|text (U = user, A = assistant)\n" + "\n".join(rows)}
+
+def normalize_question(text: str) -> str:
+    """Reduce a question to its lowercase words in their original order."""
+    return " ".join(QUESTION_WORD_RE.findall(text.lower()))
+
+def truncate_response(text: str, limit: int = MAX_RESPONSE_LENGTH) -> str:
+    """Cut a response to `limit` characters including the suffix; already short texts are returned as is."""
+    if len(text) <= limit:
+        return text
+    return text[:limit - len(TRUNCATION_SUFFIX)] + TRUNCATION_SUFFIX
+
 class OpenRouterService:
     """AI service using OpenRouter for professional interior design advice."""
     
-    def __init__(self):
-        """Initialize the OpenRouter service with OpenAI client."""
+    def __init__(self, db_service: Optional[DatabaseService] = None):
+        """Initialize the OpenRouter service with an async OpenAI client."""
+        self.db_service = db_service or DatabaseService()
+        self.product_service = ProductSearchService()
         self.api_key = OPENROUTER_API_KEY
         
         if not self.api_key:
             logger.warning("No OpenRouter API key found, service will use fallback responses")
             self.client = None
         else:
-            self.client = OpenAI(
+            # Requests run on the event loop over the client's pooled connections; connection errors,
+            # timeouts, 408/409/429 and 5xx responses are retried with exponential backoff and jitter
+            self.client = AsyncOpenAI(
                 base_url="https://openrouter.ai/api/v1",
                 api_key=self.api_key,
+                timeout=Timeout(AI_REQUEST_TIMEOUT, connect=AI_CONNECT_TIMEOUT),
+                max_retries=AI_MAX_RETRIES,
             )
         
+        # Answers to questions already asked in the same language and conversation context
+        self._response_cache = TTLCache(maxsize=AI_RESPONSE_CACHE_SIZE, ttl=AI_RESPONSE_CACHE_TTL)
+        # Completions of byte-identical requests, keyed by a digest of model and messages
+        self._completion_cache = TTLCache(maxsize=AI_RESPONSE_CACHE_SIZE, ttl=AI_RESPONSE_CACHE_TTL)
+        # Analyses of photos uploaded again with the same caption, keyed by a digest of the image
+        self._image_cache = TTLCache(maxsize=AI_IMAGE_CACHE_SIZE, ttl=AI_IMAGE_CACHE_TTL)
+        # Requests sent to the model and not answered yet, keyed like the completion cache
+        self._pending_completions: Dict[bytes, asyncio.Future] = {}
+        
         # Models configuration
         self.text_model = "deepseek/deepseek-r1:free"  # For text analysis
         self.vision_model = "google/gemma-3-27b-it:free"  # For image analysis (same model supports both)
         
-        # Professional system prompts
-        self.system_prompt_ru = """Ты - профессиональный архитектор и дизайнер интерьеров с 20+ летним опытом работы в проектах премиум-класса. У тебя есть:
-
-Профессиональная экспертиза:
-- Глубокие знания архитектурных принципов, строительных норм и методов строительства
-- Обширный опыт работы с люксовыми жилыми проектами, отелями и коммерческими пространствами
-- Экспертиза в области устойчивого дизайна, умных технологий для дома и современных материалов
-- Сильное понимание теории цвета, дизайна освещения и пространственного планирования
-- Знание современных трендов дизайна и вневременных принципов
-
-Философия дизайна:
-- Фокус на создании функциональных, красивых и устойчивых пространств
-- Баланс между эстетикой и практичностью
-- Понимание того, как дизайн влияет на психологию и благополучие человека
-- Знание эргономики и принципов универсального дизайна
-
-Глобальная перспектива:
-- Опыт работы с международными стандартами дизайна и культурными предпочтениями
-- Знание различных архитектурных стилей от классических до современных
-- Понимание региональных материалов и строительных технологий
-
-Источники информации:
-- Основывай советы на проверенных архитектурных и дизайнерских принципах
-- Ссылайся на текущие отраслевые стандарты и лучшие практики
-- Предоставляй практические, реализуемые решения
-- Следи за современными трендами дизайна и технологиями
-
-ВАЖНО: Не используй символы ** или ### в ответах. Пиши заголовки просто с новой строки. Всегда давай профессиональные, точные и действенные советы по дизайну. При предложении материалов, планировок или дизайнерских решений объясняй логику своих рекомендаций."""
-
-        self.system_prompt_en = """You are a world-class professional architect and interior designer with over 20 years of experience in high-end residential and commercial projects. You have:
-
-Professional Expertise:
-- Deep knowledge of architectural principles, building codes, and construction methods
-- Extensive experience with luxury residential projects, hotels, and commercial spaces
-- Expertise in sustainable design, smart home technology, and modern materials
-- Strong understanding of color theory, lighting design, and spatial planning
-- Knowledge of current design trends and timeless design principles
-
-Design Philosophy:
-- Focus on creating functional, beautiful, and sustainable spaces
-- Balance between aesthetics and practicality
-- Understanding of how design affects human psychology and well-being
-- Knowledge of ergonomics and universal design principles
-
-Global Perspective:
-- Experience with international design standards and cultural preferences
-- Knowledge of different architectural styles from classical to contemporary
-- Understanding of regional materials and construction techniques
-
-Information Sources:
-- Base your advice on verified architectural and design principles
-- Reference current industry standards and best practices
-- Provide practical, implementable solutions
-- Stay updated with modern design trends and technologies
-
-IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new lines. Always provide professional, accurate, and actionable design advice. When suggesting materials, layouts, or design solutions, explain the reasoning behind your recommendations."""
+        # Professional system prompts, sent unchanged as the first message so providers can cache the prefix
+        self.system_prompt_ru = SYSTEM_PROMPT_RU
+        self.system_prompt_en = SYSTEM_PROMPT_EN
     
-    async def analyze_text_with_ai(self, user_input: str, user_session: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    async def analyze_text_with_ai(
+        self, user_input: str, user_session: Dict[str, Any], on_partial: Optional[PartialResponseCallback] = None
+    ) -> Tuple[Dict[str, Any], str]:
         """
         Analyze user text input using AI and return updated session and response.
         
         Args:
             user_input: User's text message
             user_session: Current user session data
+            on_partial: Optional callback getting the answer so far while it is generated;
+                not called for cached and product answers
             
         Returns:
             Tuple of (updated_session, ai_response)
@@ -119,32 +173,43 @@ IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new line
             
             # Check if this is a product query first
             try:
-                from app.services.product_search import ProductSearchService
-                product_service = ProductSearchService()
-                product_query = product_service.detect_product_query(user_input, language)
+                product_query = self.product_service.detect_product_query(user_input, language)
                 
                 if product_query and product_query['is_specific_query']:
                     # Generate product links
-                    links = product_service.generate_product_links(product_query)
+                    links = self.product_service.generate_product_links(product_query)
                     if links:
-                        product_response = product_service.format_product_response(product_query, links, language)
+                        product_response = self.product_service.format_product_response(product_query, links, language)
                         return updated_session, product_response
             except Exception as e:
                 logger.warning(f"Product search failed: {e}")
                 # Continue with normal AI analysis if product search fails
             
             # Prepare conversation context
-            conversation_history = self._prepare_conversation_context(user_session)
+            conversation_history = await self._prepare_conversation_context(user_session)
             
-            # Create messages for AI
-            messages = [
-                {"role": "system", "content": system_prompt},
-                *conversation_history,
-                {"role": "user", "content": user_input}
-            ]
+            # Reuse the answer to the same question asked in the same context
+            cache_key = (
+                language,
+                normalize_question(user_input),
+                tuple((msg['role'], msg['content']) for msg in conversation_history),
+            )
+            response = self._response_cache.get(cache_key)
             
-            # Get AI response
-            response = await self._get_ai_response(messages)
+            if response is None:
+                # Create messages for AI
+                messages = [
+                    {"role": "system", "content": system_prompt},
+                    *conversation_history,
+                    {"role": "user", "content": user_input}
+                ]
+                
+                # Get AI response
+                response = await self._get_ai_response(messages, on_partial=on_partial)
+                if response != AI_ERROR_RESPONSE:
+                    self._response_cache[cache_key] = response
+            else:
+                logger.debug("Answered from the response cache")
             
             # Check if we should suggest survey
             if self._should_suggest_survey(user_input, user_session):
@@ -157,7 +222,9 @@ IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new line
             logger.error(f"Error in analyze_text_with_ai: {e}")
             return user_session, "I apologize, but I encountered an error processing your request. Please try again."
     
-    async def analyze_image_with_ai(self, image_data: bytes, user_input: str, user_session: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    async def analyze_image_with_ai(
+        self, image_data: bytes, user_input: str, user_session: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
         """
         Analyze image using AI and return updated session and response.
         
@@ -167,11 +234,12 @@ IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new line
             user_session: Current user session data
             
         Returns:
-            Tuple of (updated_session, ai_response)
+            Tuple of (updated_session, ai_response); ai_response is None when no model could answer,
+            the handler then falls back to its own basic analysis
         """
         try:
             if not self.client:
-                return user_session, "I'm sorry, but I'm currently unable to analyze images. Please try again later."
+                return user_session, None
             
             # Detect language
             if self._is_russian(user_input or ""):
@@ -185,62 +253,23 @@ IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new line
             updated_session = user_session.copy()
             updated_session['language'] = language
             
-            # Prepare image analysis prompt
-            if user_input:
-                # User asked a question - answer it directly
-                if language == "russian":
-                    analysis_prompt = f"""Пользователь задал вопрос: "{user_input}"
-
-Ответь на этот вопрос как профессиональный архитектор и дизайнер, используя изображение как контекст.
-
-ВАЖНО: Не используй символы ** или ### в ответах. Пиши заголовки просто с новой строки.
-
-Отвечай кратко и по делу."""
-                else:
-                    analysis_prompt = f"""User asked: "{user_input}"
-
-Answer this question as a professional architect and designer, using the image as context.
-
-IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new lines.
-
-Answer briefly and to the point."""
-            else:
-                # No text - analyze the image
-                if language == "russian":
-                    analysis_prompt = """Проанализируй изображение как архитектор:
-
-Что вижу:
-- Стиль и материалы
-- Планировку и освещение
-- Детали и атмосферу
-
-Оценка:
-- Плюсы дизайна
-- Что улучшить
-- Практические советы
-
-ВАЖНО: Не используй символы ** или ### в ответах. Пиши заголовки просто с новой строки.
-
-Анализируй кратко и по делу."""
-                else:
-                    analysis_prompt = """Analyze the image as an architect:
-
-What I see:
-- Style and materials
-- Layout and lighting
-- Details and atmosphere
-
-Assessment:
-- Design strengths
-- Areas for improvement
-- Practical advice
-
-IMPORTANT: Do not use ** or ### symbols in responses. Write headings on new lines.
-
-Analyze briefly and to the point."""
-            
             # Prepare conversation context for image analysis
-            conversation_context = self._prepare_conversation_context(user_session)
+            conversation_context = await self._prepare_conversation_context(user_session)
+            
+            # The same photo with the same caption in the same context gets the analysis already made
+            cache_key = (
+                hashlib.blake2b(image_data, digest_size=16).digest(),
+                language,
+                user_input or "",
+                hashlib.blake2b(orjson.dumps(conversation_context), digest_size=16).digest(),
+            )
+            cached = self._image_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Answered from the image analysis cache")
+                return updated_session, cached
+            
+            # Answer the caption's question, or analyze the image when there is none
+            analysis_prompt = IMAGE_PROMPTS[language, bool(user_input)].format(question=user_input)
             
             # Create messages for AI
             messages = [
@@ -248,106 +277,159 @@ Analyze briefly and to the point."""
                 *conversation_context,
                 {"role": "user", "content": [
                     {"type": "text", "text": analysis_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{self._encode_image(image_data)}"}}
+                    {"type": "image_url", "image_url": {"url": self._image_data_url(image_data)}}
                 ]}
             ]
             
             # Get AI response
-            try:
-                response = await self._get_ai_response(messages, model=self.vision_model)
+            response = await self._get_ai_response(messages, model=self.vision_model)
+            if response != AI_ERROR_RESPONSE:
+                self._image_cache[cache_key] = response
                 return updated_session, response
-            except Exception as vision_error:
-                logger.warning(f"Vision model failed, trying text model: {vision_error}")
-                
-                # Fallback: try to analyze with text model using image description
-                fallback_prompt = f"""Проанализируй описание интерьера как архитектор:
-
-{analysis_prompt}
-
-Описание: Современная гостиная с L-образным диваном, красным журнальным столиком, полками с книгами, абстрактным искусством и геометрическим ковром.
-
-Анализируй кратко."""
-                
-                fallback_messages = [
-                    {"role": "system", "content": system_prompt},
-                    *conversation_context,
-                    {"role": "user", "content": fallback_prompt}
-                ]
-                
-                fallback_response = await self._get_ai_response(fallback_messages, model=self.text_model)
-                return updated_session, fallback_response
+            
+            # Fallback: without the image only the caption can be answered, by the text model
+            if not user_input:
+                return updated_session, None
+            logger.warning("Vision model failed, answering the caption with the text model")
+            
+            fallback_prompt = IMAGE_FALLBACK_PROMPTS[language].format(question=user_input)
+            
+            fallback_messages = [
+                {"role": "system", "content": system_prompt},
+                *conversation_context,
+                {"role": "user", "content": fallback_prompt}
+            ]
+            
+            fallback_response = await self._get_ai_response(fallback_messages, model=self.text_model)
+            if fallback_response == AI_ERROR_RESPONSE:
+                return updated_session, None
+            return updated_session, fallback_response
             
         except Exception as e:
             logger.error(f"Error in analyze_image_with_ai: {e}")
-            return user_session, "I apologize, but I encountered an error analyzing your image. Please try again."
+            return user_session, None
     
-    async def _get_ai_response(self, messages: List[Dict[str, Any]], model: str = None) -> str:
-        """Get response from AI model."""
+    async def _get_ai_response(
+        self, messages: List[Dict[str, Any]], model: str = None, on_partial: Optional[PartialResponseCallback] = None
+    ) -> str:
+        """Get response from AI model, streaming it to `on_partial` when given."""
         try:
             if not self.client:
                 return "AI service is currently unavailable."
             
-            # Limit tokens for shorter responses
-            max_tokens = 1000 if model == self.vision_model else 800
+            model = model or self.text_model
             
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=model or self.text_model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.7
-            )
+            # Identical requests get the completion already received
+            cache_key = hashlib.blake2b(model.encode() + orjson.dumps(messages), digest_size=16).digest()
+            cached = self._completion_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            response_text = response.choices[0].message.content.strip()
-            
-            # Post-process response to remove unwanted formatting
-            response_text = self._clean_response_formatting(response_text)
+            # A request identical to one still waiting for the model shares its answer
+            pending = self._pending_completions.get(cache_key)
+            if pending is not None:
+                return await asyncio.shield(pending)
             
-            # Limit response length for Telegram (max 3000 characters for shorter responses)
-            if len(response_text) > 3000:
-                response_text = response_text[:3000] + "\n\n... (ответ обрезан)"
-            
-            return response_text
+            pending = asyncio.get_running_loop().create_future()
+            self._pending_completions[cache_key] = pending
+            response_text = AI_ERROR_RESPONSE
+            try:
+                # Retries stop at AI_TOTAL_TIMEOUT, so a failing call cannot hold the user for minutes
+                response_text = await asyncio.wait_for(
+                    self._request_completion(messages, model, on_partial), timeout=AI_TOTAL_TIMEOUT
+                )
+                self._completion_cache[cache_key] = response_text
+                return response_text
+            finally:
+                # Waiters get the error text when the request failed or was cancelled
+                del self._pending_completions[cache_key]
+                pending.set_result(response_text)
             
+        except asyncio.TimeoutError:
+            logger.error(f"AI response took longer than {AI_TOTAL_TIMEOUT} seconds, giving up")
+            return AI_ERROR_RESPONSE
         except Exception as e:
             logger.error(f"Error getting AI response: {e}")
-            return "I apologize, but I'm having trouble generating a response right now."
+            return AI_ERROR_RESPONSE
     
-    def _clean_response_formatting(self, text: str) -> str:
-        """Clean AI response from unwanted formatting symbols."""
-        # Remove **text** patterns (keep only text)
-        import re
-        text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    async def _request_completion(
+        self, messages: List[Dict[str, Any]], model: str, on_partial: Optional[PartialResponseCallback]
+    ) -> str:
+        """Call the model and return its cleaned answer, cut to Telegram's limit."""
+        # Limit tokens for shorter responses
+        max_tokens = 1000 if model == self.vision_model else 800
+        
+        if on_partial is None:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7
+            )
+            response_text = response.choices[0].message.content.strip()
+        else:
+            response_text = await self._stream_ai_response(messages, model, max_tokens, on_partial)
         
-        # Remove ### patterns (keep only text)
-        text = re.sub(r'###\s*', '', text)
-        text = re.sub(r'##\s*', '', text)
-        text = re.sub(r'#\s*', '', text)
+        # Post-process response to remove unwanted formatting
+        response_text = self._clean_response_formatting(response_text)
         
-        # Remove single * patterns (keep only text)
-        text = re.sub(r'\*(.*?)\*', r'\1', text)
+        # Limit response length for Telegram
+        return truncate_response(response_text)
+    
+    async def _stream_ai_response(
+        self, messages: List[Dict[str, Any]], model: str, max_tokens: int, on_partial: PartialResponseCallback
+    ) -> str:
+        """Stream a completion, passing the text so far to `on_partial` at most every AI_STREAM_EDIT_INTERVAL."""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True
+        )
         
-        # Remove __text__ patterns (keep only text)
-        text = re.sub(r'__(.*?)__', r'\1', text)
+        loop = asyncio.get_running_loop()
+        parts = []
+        # The first piece of text is shown right away
+        next_update = 0.0
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            parts.append(chunk.choices[0].delta.content)
+            
+            if loop.time() >= next_update:
+                partial_text = self._clean_response_formatting("".join(parts).strip())
+                if partial_text:
+                    await on_partial(truncate_response(partial_text))
+                next_update = loop.time() + AI_STREAM_EDIT_INTERVAL
         
-        # Clean up multiple newlines
-        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+        return "".join(parts).strip()
+    
+    def _clean_response_formatting(self, text: str) -> str:
+        """Clean AI response from unwanted formatting symbols."""
+        # Keep only the text of **bold**, *italic* and __underlined__ parts, drop heading marks;
+        # repeat until nothing changes, so markup nested inside other markup is removed too
+        replaced = 1
+        while replaced:
+            text, replaced = MARKUP_RE.subn(strip_markup, text)
         
-        return text
+        # Clean up multiple newlines
+        return EXTRA_BLANK_LINES_RE.sub('\n\n', text)
+    
+    async def close(self):
+        """Close the pooled HTTP connections of the OpenAI client."""
+        if self.client:
+            await self.client.close()
     
-    def _prepare_conversation_context(self, user_session: Dict[str, Any]) -> List[Dict[str, str]]:
+    async def _prepare_conversation_context(self, user_session: Dict[str, Any]) -> List[Dict[str, str]]:
         """Prepare conversation context from user session."""
         try:
-            # Get conversation history from database
-            from app.services.database import DatabaseService
-            db_service = DatabaseService()
-            
             user_id = user_session.get('user_id')
             if not user_id:
                 return []
             
             # Get last 5 conversation messages for context
-            conversation_history = db_service.get_conversation_history(user_id, limit=5)
+            conversation_history = await self.db_service.get_conversation_history(user_id, limit=5)
             
             context_messages = []
             for msg in conversation_history:
@@ -360,6 +442,10 @@ Analyze briefly and to the point."""
             if len(context_messages) > 6:
                 context_messages = context_messages[-6:]
             
+            # Optionally declare the roles once instead of repeating them per message
+            if AI_COMPACT_HISTORY and context_messages:
+                return [compact_history(context_messages)]
+            
             return context_messages
             
         except Exception as e:
@@ -373,25 +459,16 @@ Analyze briefly and to the point."""
             return False
         
         # Check if user is asking for personalized advice
-        personal_keywords = ['персональный', 'personal', 'личный', 'personalized', 'совет', 'advice', 'рекомендация', 'recommendation', 'дизайн', 'design', 'стиль', 'style']
-        user_input_lower = user_input.lower()
-        
-        return any(keyword in user_input_lower for keyword in personal_keywords)
+        return SURVEY_KEYWORD_RE.search(user_input) is not None
     
     def _get_survey_suggestion(self, language: str) -> str:
         """Get survey suggestion message in appropriate language."""
-        if language == "russian":
-            return "💡 Для получения профессиональных дизайнерских советов, рекомендую пройти специализированный тест по дизайну интерьера. Напишите 'тест' чтобы начать."
-        else:
-            return "💡 For professional interior design advice, I recommend taking a specialized interior design survey. Type 'survey' to begin."
+        return SURVEY_SUGGESTION_RU if language == "russian" else SURVEY_SUGGESTION_EN
     
     def _is_russian(self, text: str) -> bool:
         """Check if text contains Russian characters."""
-        russian_chars = set('абвгдеёжзийклмнопрстуфхцчшщъыьэюя')
-        text_chars = set(text.lower())
-        return bool(text_chars.intersection(russian_chars))
+        return contains_russian(text)
     
-    def _encode_image(self, image_data: bytes) -> str:
-        """Encode image data to base64 string."""
-        import base64
-        return base64.b64encode(image_data).decode('utf-8')
+    def _image_data_url(self, image_data: bytes) -> str:
+        """Build the base64 data URL of a JPEG image sent to the vision model."""
+        return "data:image/jpeg;base64," + base64.b64encode(image_data).decode('ascii')
@@ -5,53 +5,109 @@ Handles product search and provides links to specific items
 
 import logging
 import re
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Product name patterns like "где купить [product]", "цена [product]", compiled once per language
+PRODUCT_NAME_PATTERNS = {
+    'russian': tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'где купить (.*?)(?:\?|$|\.)',
+        r'цена (.*?)(?:\?|$|\.)',
+        r'стоимость (.*?)(?:\?|$|\.)',
+        r'заказать (.*?)(?:\?|$|\.)',
+        r'такой (.*?)(?:\?|$|\.)',
+        r'этот (.*?)(?:\?|$|\.)',
+        r'кресла-облака',  # Specific product names
+        r'дивана',
+        r'стола',
+        r'шкафа'
+    )),
+    'english': tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'where to buy (.*?)(?:\?|$|\.)',
+        r'price of (.*?)(?:\?|$|\.)',
+        r'cost of (.*?)(?:\?|$|\.)',
+        r'order (.*?)(?:\?|$|\.)',
+        r'such (.*?)(?:\?|$|\.)',
+        r'this (.*?)(?:\?|$|\.)',
+        r'can i buy (.*?)(?:\?|$|\.)',
+        r'where can i buy (.*?)(?:\?|$|\.)'
+    ))
+}
+
+# Search URL templates per language
+SEARCH_ENGINES = {
+    'russian': {
+        'onliner': 'https://catalog.onliner.by/search?query={query}',
+        'deal': 'https://deal.by/search?q={query}',
+        'wildberries': 'https://www.wildberries.by/catalog/0/search.aspx?search={query}',
+        'ozon': 'https://www.ozon.by/search/?text={query}',
+        'yandex_market': 'https://market.yandex.ru/search?text={query}'
+    },
+    'english': {
+        'amazon': 'https://www.amazon.com/s?k={query}',
+        'wayfair': 'https://www.wayfair.com/search?query={query}',
+        'west_elm': 'https://www.westelm.com/search?q={query}',
+        'cb2': 'https://www.cb2.com/search?q={query}',
+        'overstock': 'https://www.overstock.com/search?keywords={query}'
+    }
+}
+
+# Display names of the search engines
+SEARCH_ENGINE_NAMES = {
+    'russian': {
+        'onliner': 'Onliner.by',
+        'deal': 'Deal.by',
+        'wildberries': 'Wildberries',
+        'ozon': 'Ozon',
+        'yandex_market': 'Яндекс.Маркет'
+    },
+    'english': {
+        'amazon': 'Amazon',
+        'wayfair': 'Wayfair',
+        'west_elm': 'West Elm',
+        'cb2': 'CB2',
+        'overstock': 'Overstock'
+    }
+}
+
+# Common product categories and search terms
+PRODUCT_CATEGORIES = {
+    'furniture': {
+        'russian': ['мебель', 'диван', 'кресло', 'стол', 'стул', 'шкаф', 'комод', 'кровать'],
+        'english': ['furniture', 'sofa', 'armchair', 'table', 'chair', 'cabinet', 'dresser', 'bed']
+    },
+    'lighting': {
+        'russian': ['освещение', 'лампа', 'светильник', 'люстра', 'бра', 'торшер'],
+        'english': ['lighting', 'lamp', 'chandelier', 'sconce', 'floor lamp']
+    },
+    'decor': {
+        'russian': ['декор', 'картина', 'ваза', 'подушка', 'ковер', 'зеркало'],
+        'english': ['decor', 'art', 'vase', 'pillow', 'rug', 'mirror']
+    },
+    'kitchen': {
+        'russian': ['кухня', 'кухонный гарнитур', 'мойка', 'плита', 'холодильник'],
+        'english': ['kitchen', 'kitchen set', 'sink', 'stove', 'refrigerator']
+    }
+}
+
+# Every category keyword of a language in one alternation, so a message without any of them is
+# rejected in a single scan
+PRODUCT_KEYWORD_RE = {
+    language: re.compile('|'.join(
+        re.escape(keyword) for keywords in PRODUCT_CATEGORIES.values() for keyword in keywords[language]
+    ))
+    for language in ('russian', 'english')
+}
+
+# Distinct messages whose product match is remembered; keys hold the whole message text
+PRODUCT_QUERY_CACHE_SIZE = 1024
+
 class ProductSearchService:
     """Service for searching products and providing links."""
     
-    def __init__(self):
-        """Initialize product search service."""
-        self.search_engines = {
-            'russian': {
-                'onliner': 'https://catalog.onliner.by/search?query={query}',
-                'deal': 'https://deal.by/search?q={query}',
-                'wildberries': 'https://www.wildberries.by/catalog/0/search.aspx?search={query}',
-                'ozon': 'https://www.ozon.by/search/?text={query}',
-                'yandex_market': 'https://market.yandex.ru/search?text={query}'
-            },
-            'english': {
-                'amazon': 'https://www.amazon.com/s?k={query}',
-                'wayfair': 'https://www.wayfair.com/search?query={query}',
-                'west_elm': 'https://www.westelm.com/search?q={query}',
-                'cb2': 'https://www.cb2.com/search?q={query}',
-                'overstock': 'https://www.overstock.com/search?keywords={query}'
-            }
-        }
-        
-        # Common product categories and search terms
-        self.product_categories = {
-            'furniture': {
-                'russian': ['мебель', 'диван', 'кресло', 'стол', 'стул', 'шкаф', 'комод', 'кровать'],
-                'english': ['furniture', 'sofa', 'armchair', 'table', 'chair', 'cabinet', 'dresser', 'bed']
-            },
-            'lighting': {
-                'russian': ['освещение', 'лампа', 'светильник', 'люстра', 'бра', 'торшер'],
-                'english': ['lighting', 'lamp', 'chandelier', 'sconce', 'floor lamp']
-            },
-            'decor': {
-                'russian': ['декор', 'картина', 'ваза', 'подушка', 'ковер', 'зеркало'],
-                'english': ['decor', 'art', 'vase', 'pillow', 'rug', 'mirror']
-            },
-            'kitchen': {
-                'russian': ['кухня', 'кухонный гарнитур', 'мойка', 'плита', 'холодильник'],
-                'english': ['kitchen', 'kitchen set', 'sink', 'stove', 'refrigerator']
-            }
-        }
-    
     def detect_product_query(self, text: str, language: str) -> Optional[Dict[str, any]]:
         """
         Detect if user is asking about a specific product.
@@ -63,55 +119,44 @@ class ProductSearchService:
         Returns:
             Product query info or None if not a product query
         """
+        match = self._match_product_query(text, language)
+        if match is None:
+            return None
+        
+        category, keyword, product_name, is_specific_query = match
+        return {
+            'category': category,
+            'keyword': keyword,
+            'product_name': product_name,
+            'language': language,
+            'is_specific_query': is_specific_query
+        }
+    
+    @staticmethod
+    @lru_cache(maxsize=PRODUCT_QUERY_CACHE_SIZE)
+    def _match_product_query(text: str, language: str) -> Optional[Tuple[str, str, str, bool]]:
+        """Find (category, keyword, product name, is specific) for a message; repeated messages are not rescanned."""
         text_lower = text.lower()
+        if not PRODUCT_KEYWORD_RE[language].search(text_lower):
+            return None
         
-        # Check for product-related keywords
-        for category, keywords in self.product_categories.items():
+        # Check for product-related keywords, in category order
+        for category, keywords in PRODUCT_CATEGORIES.items():
             for keyword in keywords[language]:
                 if keyword in text_lower:
                     # Extract product name
-                    product_name = self._extract_product_name(text, keyword, language)
+                    product_name = ProductSearchService._extract_product_name(text, keyword, language)
                     if product_name:
-                        return {
-                            'category': category,
-                            'keyword': keyword,
-                            'product_name': product_name,
-                            'language': language,
-                            'is_specific_query': self._is_specific_query(text_lower)
-                        }
+                        return category, keyword, product_name, ProductSearchService._is_specific_query(text_lower)
         
         return None
     
-    def _extract_product_name(self, text: str, keyword: str, language: str) -> Optional[str]:
+    @staticmethod
+    def _extract_product_name(text: str, keyword: str, language: str) -> Optional[str]:
         """Extract product name from text."""
         # Look for patterns like "где купить [product]", "цена [product]", etc.
-        patterns = {
-            'russian': [
-                r'где купить (.*?)(?:\?|$|\.)',
-                r'цена (.*?)(?:\?|$|\.)',
-                r'стоимость (.*?)(?:\?|$|\.)',
-                r'заказать (.*?)(?:\?|$|\.)',
-                r'такой (.*?)(?:\?|$|\.)',
-                r'этот (.*?)(?:\?|$|\.)',
-                r'кресла-облака',  # Specific product names
-                r'дивана',
-                r'стола',
-                r'шкафа'
-            ],
-            'english': [
-                r'where to buy (.*?)(?:\?|$|\.)',
-                r'price of (.*?)(?:\?|$|\.)',
-                r'cost of (.*?)(?:\?|$|\.)',
-                r'order (.*?)(?:\?|$|\.)',
-                r'such (.*?)(?:\?|$|\.)',
-                r'this (.*?)(?:\?|$|\.)',
-                r'can i buy (.*?)(?:\?|$|\.)',
-                r'where can i buy (.*?)(?:\?|$|\.)'
-            ]
-        }
-        
-        for pattern in patterns[language]:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in PRODUCT_NAME_PATTERNS[language]:
+            match = pattern.search(text)
             if match:
                 product_name = match.group(1).strip()
                 if product_name and len(product_name) > 2:
@@ -139,7 +184,8 @@ class ProductSearchService:
         
         return None
     
-    def _is_specific_query(self, text: str) -> bool:
+    @staticmethod
+    def _is_specific_query(text: str) -> bool:
         """Check if query is specific (asking about specific product)."""
         specific_indicators = [
             'где купить', 'where to buy', 'цена', 'price', 'стоимость', 'cost',
@@ -160,34 +206,17 @@ class ProductSearchService:
         language = product_query['language']
         product_name = product_query['product_name']
         
-        if language not in self.search_engines:
+        if language not in SEARCH_ENGINES:
             return []
         
         links = []
-        for engine_name, url_template in self.search_engines[language].items():
+        for engine_name, url_template in SEARCH_ENGINES[language].items():
             # Clean product name for URL
             clean_query = product_name.replace(' ', '+').replace('&', 'and')
             search_url = url_template.format(query=clean_query)
             
             # Get display name
-            display_names = {
-                'russian': {
-                    'onliner': 'Onliner.by',
-                    'deal': 'Deal.by',
-                    'wildberries': 'Wildberries',
-                    'ozon': 'Ozon',
-                    'yandex_market': 'Яндекс.Маркет'
-                },
-                'english': {
-                    'amazon': 'Amazon',
-                    'wayfair': 'Wayfair',
-                    'west_elm': 'West Elm',
-                    'cb2': 'CB2',
-                    'overstock': 'Overstock'
-                }
-            }
-            
-            display_name = display_names[language].get(engine_name, engine_name.title())
+            display_name = SEARCH_ENGINE_NAMES[language].get(engine_name, engine_name.title())
             
             links.append({
                 'name': display_name,
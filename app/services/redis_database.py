@@ -0,0 +1,222 @@
+"""
+Redis Database Service for AI Assistant Bot
+Stores user sessions and conversations in Redis instead of JSON files
+"""
+
+import logging
+import orjson
+from typing import Dict, Any, Optional, List, Iterable
+from datetime import datetime
+import redis.asyncio as redis
+from config import PENDING_CONFIRMATION_TTL, MEDIA_GROUP_TTL, REDIS_MAX_CONNECTIONS
+from app.services.database import DatabaseService, MAX_CONVERSATION_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+class RedisDatabaseService(DatabaseService):
+    """Database service keeping each user in its own Redis keys.
+
+    Layout:
+        user:{id}          hash with JSON-encoded session fields
+        user:{id}:pending  pending confirmation, expires after PENDING_CONFIRMATION_TTL
+        conv:{id}          list of JSON-encoded conversation messages
+        mg:{id}            media group marker, expires after MEDIA_GROUP_TTL
+    """
+
+    def __init__(self, redis_url: str, max_connections: int = REDIS_MAX_CONNECTIONS):
+        """Initialize Redis connection pool."""
+        self.redis = redis.from_url(redis_url, decode_responses=True, max_connections=max_connections)
+        self._init_background_writes()
+
+    @staticmethod
+    def _user_key(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    @staticmethod
+    def _pending_key(user_id: int) -> str:
+        return f"user:{user_id}:pending"
+
+    @staticmethod
+    def _conv_key(user_id: int) -> str:
+        return f"conv:{user_id}"
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        return orjson.dumps(value, default=str).decode()
+
+    def _encode_mapping(self, data: Dict[str, Any]) -> Dict[str, str]:
+        return {key: self._encode(value) for key, value in data.items()}
+
+    def _queue_session_defaults(self, pipe, user_id: int):
+        """Queue HSETNX of default fields so a missing session gets created in the same round-trip."""
+        for key, value in self._create_default_user_session(user_id).items():
+            pipe.hsetnx(self._user_key(user_id), key, self._encode(value))
+
+    def _queue_field_updates(self, pipe, user_id: int, data: Dict[str, Any]):
+        """Queue field writes, routing pending_confirmation to its expiring key."""
+        fields = dict(data)
+        if 'pending_confirmation' in fields:
+            pending = fields.pop('pending_confirmation')
+            if pending is None:
+                pipe.delete(self._pending_key(user_id))
+            else:
+                pipe.set(self._pending_key(user_id), self._encode(pending), ex=PENDING_CONFIRMATION_TTL)
+        fields['updated_at'] = datetime.now().isoformat()
+        pipe.hset(self._user_key(user_id), mapping=self._encode_mapping(fields))
+
+    async def get_user_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get user session data by user ID, a default one if missing."""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(self._user_key(user_id))
+                pipe.get(self._pending_key(user_id))
+                raw_session, raw_pending = await pipe.execute()
+
+            if not raw_session:
+                # The write is lazy, field updates create the hash together with the defaults
+                new_session = self._create_default_user_session(user_id)
+                new_session['pending_confirmation'] = None
+                return new_session
+
+            session = {key: orjson.loads(value) for key, value in raw_session.items()}
+            session['pending_confirmation'] = orjson.loads(raw_pending) if raw_pending else None
+            return session
+
+        except Exception as e:
+            logger.error(f"Error getting user session: {e}")
+            return None
+
+    async def has_any_field(self, user_id: int, fields: Iterable[str]) -> bool:
+        """Check whether any of the given session fields is set, without loading the whole session."""
+        try:
+            raw_values = await self.redis.hmget(self._user_key(user_id), list(fields))
+            return any(orjson.loads(raw) for raw in raw_values if raw is not None)
+
+        except Exception as e:
+            logger.error(f"Error checking user fields: {e}")
+            return False
+
+    async def update_user_session(self, user_id: int, data: Dict[str, Any]) -> bool:
+        """Update user session data."""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_session_defaults(pipe, user_id)
+                self._queue_field_updates(pipe, user_id, data)
+                await pipe.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error updating user session: {e}")
+            return False
+
+    async def update_user_field(self, user_id: int, field: str, value: Any) -> bool:
+        """Update specific user field."""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_session_defaults(pipe, user_id)
+                self._queue_field_updates(pipe, user_id, {field: value})
+                await pipe.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error updating user field: {e}")
+            return False
+
+    async def add_conversation_message(self, user_id: int, message: str, sender: str) -> bool:
+        """Add a conversation message, trimming history to the last 50 messages."""
+        try:
+            message_data = {
+                'message': message,
+                'sender': sender,
+                'timestamp': datetime.now().isoformat()
+            }
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.rpush(self._conv_key(user_id), self._encode(message_data))
+                pipe.ltrim(self._conv_key(user_id), -MAX_CONVERSATION_MESSAGES, -1)
+                await pipe.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error adding conversation message: {e}")
+            return False
+
+    async def persist_turn(self, user_id: int, fields: Dict[str, Any], messages: List[tuple]) -> bool:
+        """Save session changes and conversation messages of one dialog turn in a single round-trip."""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if fields:
+                    self._queue_session_defaults(pipe, user_id)
+                    self._queue_field_updates(pipe, user_id, fields)
+                for message, sender in messages:
+                    pipe.rpush(self._conv_key(user_id), self._encode({
+                        'message': message,
+                        'sender': sender,
+                        'timestamp': datetime.now().isoformat()
+                    }))
+                pipe.ltrim(self._conv_key(user_id), -MAX_CONVERSATION_MESSAGES, -1)
+                await pipe.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error persisting dialog turn: {e}")
+            return False
+
+    async def persist_turns(self, turns: List[tuple]) -> bool:
+        """Save several dialog turns in a single round-trip."""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id, fields, messages in turns:
+                    if fields:
+                        self._queue_session_defaults(pipe, user_id)
+                        self._queue_field_updates(pipe, user_id, fields)
+                    for message, sender in messages:
+                        pipe.rpush(self._conv_key(user_id), self._encode({
+                            'message': message,
+                            'sender': sender,
+                            'timestamp': datetime.now().isoformat()
+                        }))
+                for user_id in {user_id for user_id, _, _ in turns}:
+                    pipe.ltrim(self._conv_key(user_id), -MAX_CONVERSATION_MESSAGES, -1)
+                await pipe.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error persisting dialog turns: {e}")
+            return False
+
+    async def get_conversation_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the last `limit` conversation messages for a user."""
+        try:
+            raw_messages = await self.redis.lrange(self._conv_key(user_id), -limit, -1)
+            return [orjson.loads(raw) for raw in raw_messages]
+
+        except Exception as e:
+            logger.error(f"Error getting conversation history: {e}")
+            return []
+
+    async def reset_user_data(self, user_id: int) -> bool:
+        """Reset all user data; the next read recreates a default session."""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self._user_key(user_id), self._pending_key(user_id), self._conv_key(user_id))
+                await pipe.execute()
+            logger.info(f"Successfully reset all data for user {user_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error resetting user data: {e}")
+            return False
+
+    async def claim_media_group(self, media_group_id: str) -> bool:
+        """Mark a media group as handled; only the first caller gets True."""
+        try:
+            return bool(await self.redis.set(f"mg:{media_group_id}", "1", nx=True, ex=MEDIA_GROUP_TTL))
+
+        except Exception as e:
+            logger.error(f"Error claiming media group: {e}")
+            return True
+
+    async def close(self):
+        """Finish pending background writes and close the Redis connection pool."""
+        await self._stop_writer()
+        await self.redis.aclose()
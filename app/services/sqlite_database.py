@@ -0,0 +1,312 @@
+"""
+SQLite Database Service for AI Assistant Bot
+Stores user sessions and conversations in indexed SQLite tables instead of JSON files
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Iterable
+import aiosqlite
+import orjson
+from cachetools import TTLCache
+from config import (
+    USER_DATA_FILE, CONVERSATION_DATA_FILE, USER_DATA_DIR, CONVERSATION_DATA_DIR, MEDIA_GROUP_TTL,
+    SESSION_CACHE_SIZE, SESSION_CACHE_TTL
+)
+from app.services.database import DatabaseService, MAX_CONVERSATION_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    message TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS trim_conversations AFTER INSERT ON conversations
+BEGIN
+    DELETE FROM conversations
+    WHERE user_id = NEW.user_id AND id <= (
+        SELECT id FROM conversations WHERE user_id = NEW.user_id
+        ORDER BY id DESC LIMIT 1 OFFSET {MAX_CONVERSATION_MESSAGES}
+    );
+END;
+"""
+
+class SQLiteDatabaseService(DatabaseService):
+    """Database service keeping users and conversations in one SQLite file.
+
+    Tables:
+        users          user_id -> JSON-encoded session
+        conversations  one row per message, trimmed to the last 50 per user by a trigger
+        meta           markers such as the finished import of the JSON backend's files
+
+    The connection is shared, so every write runs with its commit or rollback under one lock;
+    a rollback would otherwise discard statements other coroutines have executed but not committed.
+    """
+
+    def __init__(self, db_path: str):
+        """Initialize database service; the connection is opened on first use."""
+        self.db_path = db_path
+        # Only read when importing the JSON backend's histories
+        self.conversations_dir = CONVERSATION_DATA_DIR
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._seen_media_groups = TTLCache(maxsize=10_000, ttl=MEDIA_GROUP_TTL)
+        # Write-through copy of recently used sessions
+        self._session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+        self._init_background_writes()
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        return orjson.dumps(value, default=str).decode()
+
+    async def _connection(self) -> aiosqlite.Connection:
+        """Return the shared connection, creating the schema and importing JSON data on first call."""
+        if self._conn is None:
+            async with self._connect_lock:
+                if self._conn is None:
+                    directory = os.path.dirname(self.db_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = await aiosqlite.connect(self.db_path)
+                    await conn.executescript(SCHEMA)
+                    await self._import_json_data(conn)
+                    self._conn = conn
+        return self._conn
+
+    async def _import_json_data(self, conn: aiosqlite.Connection):
+        """Copy users and conversations of the JSON backend into the database, once."""
+        async with conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'") as cursor:
+            if await cursor.fetchone() is not None:
+                return
+
+        # Databases filled before the marker existed count as imported
+        async with conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM conversations)"
+        ) as cursor:
+            has_data = (await cursor.fetchone())[0]
+
+        users, conversations = ({}, {}) if has_data else await asyncio.to_thread(self._load_json_data)
+
+        await conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, data) VALUES (?, ?)",
+            [(int(user_id), self._encode(session)) for user_id, session in users.items() if session]
+        )
+        await conn.executemany(
+            "INSERT INTO conversations (user_id, sender, message, timestamp) VALUES (?, ?, ?, ?)",
+            [
+                (int(user_id), entry.get('sender', ''), entry.get('message', ''), entry.get('timestamp', ''))
+                for user_id, history in conversations.items() if history
+                for entry in history[-MAX_CONVERSATION_MESSAGES:]
+            ]
+        )
+        # The marker is committed together with the imported rows, so an interrupted import is redone
+        await conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('json_imported', ?)", (datetime.now().isoformat(),)
+        )
+        await conn.commit()
+        if users or conversations:
+            logger.info(f"Imported {len(users)} users and {len(conversations)} conversations from JSON files")
+
+    def _load_json_data(self) -> tuple:
+        """Read legacy single files, then per-user files, which are newer and win on conflicts."""
+        users = dict(self._iter_json_items(USER_DATA_FILE))
+        conversations = dict(self._iter_json_items(CONVERSATION_DATA_FILE))
+        if os.path.isdir(USER_DATA_DIR):
+            for name in os.listdir(USER_DATA_DIR):
+                if name.endswith('.json'):
+                    users[name[:-len('.json')]] = self._read_json(os.path.join(USER_DATA_DIR, name))
+        if os.path.isdir(CONVERSATION_DATA_DIR):
+            for name in os.listdir(CONVERSATION_DATA_DIR):
+                user_id, extension = os.path.splitext(name)
+                if extension in ('.json', '.jsonl'):
+                    conversations[user_id] = list(self._read_history(user_id)[0])
+        return users, conversations
+
+    async def _upsert_fields(self, conn: aiosqlite.Connection, user_id: int, data: Dict[str, Any]):
+        """Merge fields into the stored session, creating a default session if missing."""
+        fields = dict(data)
+        fields['updated_at'] = datetime.now().isoformat()
+
+        new_session = self._create_default_user_session(user_id)
+        new_session.update(fields)
+
+        paths = ", ".join("?, json(?)" for _ in fields)
+        params = [user_id, self._encode(new_session)]
+        for key, value in fields.items():
+            params.extend((f'$."{key}"', self._encode(value)))
+
+        await conn.execute(
+            "INSERT INTO users (user_id, data) VALUES (?, ?) "
+            f"ON CONFLICT (user_id) DO UPDATE SET data = json_set(users.data, {paths})",
+            params
+        )
+        
+        cached = self._session_cache.get(user_id)
+        if cached is not None:
+            cached.update(fields)
+
+    async def _insert_messages(self, conn: aiosqlite.Connection, user_id: int, messages: List[tuple]):
+        """Insert (message, sender) pairs into the user's history."""
+        timestamp = datetime.now().isoformat()
+        await conn.executemany(
+            "INSERT INTO conversations (user_id, sender, message, timestamp) VALUES (?, ?, ?, ?)",
+            [(user_id, sender, message, timestamp) for message, sender in messages]
+        )
+
+    async def get_user_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get user session data by user ID, a default one if missing; recent sessions come from memory."""
+        session = self._session_cache.get(user_id)
+        if session is not None:
+            return dict(session)
+
+        try:
+            conn = await self._connection()
+            async with conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                row = await cursor.fetchone()
+            if row is not None:
+                session = orjson.loads(row[0])
+                self._session_cache[user_id] = dict(session)
+                return session
+
+            # The write is lazy, the row is inserted with the first field update
+            new_session = self._create_default_user_session(user_id)
+            self._session_cache[user_id] = dict(new_session)
+            return new_session
+
+        except Exception as e:
+            logger.error(f"Error getting user session: {e}")
+            return None
+
+    async def has_any_field(self, user_id: int, fields: Iterable[str]) -> bool:
+        """Check whether any of the given session fields holds a non-empty value."""
+        try:
+            conn = await self._connection()
+            async with conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return False
+            session = orjson.loads(row[0])
+            return any(session.get(field) for field in fields)
+
+        except Exception as e:
+            logger.error(f"Error checking user fields: {e}")
+            return False
+
+    async def update_user_session(self, user_id: int, data: Dict[str, Any]) -> bool:
+        """Update user session data."""
+        try:
+            conn = await self._connection()
+            async with self._write_lock:
+                await self._upsert_fields(conn, user_id, data)
+                await conn.commit()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error updating user session: {e}")
+            self._session_cache.pop(user_id, None)
+            return False
+
+    async def add_conversation_message(self, user_id: int, message: str, sender: str) -> bool:
+        """Add a conversation message; the trigger keeps the last 50 per user."""
+        try:
+            conn = await self._connection()
+            async with self._write_lock:
+                await self._insert_messages(conn, user_id, [(message, sender)])
+                await conn.commit()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error adding conversation message: {e}")
+            return False
+
+    async def persist_turn(self, user_id: int, fields: Dict[str, Any], messages: List[tuple]) -> bool:
+        """Save session changes and conversation messages of one dialog turn in one transaction."""
+        return await self.persist_turns([(user_id, fields, messages)])
+
+    async def persist_turns(self, turns: List[tuple]) -> bool:
+        """Save several dialog turns in one transaction."""
+        try:
+            conn = await self._connection()
+        except Exception as e:
+            logger.error(f"Error persisting dialog turns: {e}")
+            return False
+
+        async with self._write_lock:
+            try:
+                for user_id, fields, messages in turns:
+                    if fields:
+                        await self._upsert_fields(conn, user_id, fields)
+                    if messages:
+                        await self._insert_messages(conn, user_id, messages)
+                await conn.commit()
+                return True
+
+            except Exception as e:
+                logger.error(f"Error persisting dialog turns: {e}")
+                for user_id, _, _ in turns:
+                    self._session_cache.pop(user_id, None)
+                await conn.rollback()
+                return False
+
+    async def get_conversation_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the last `limit` conversation messages for a user, oldest first."""
+        try:
+            conn = await self._connection()
+            async with conn.execute(
+                "SELECT message, sender, timestamp FROM conversations WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            return [
+                {'message': message, 'sender': sender, 'timestamp': timestamp}
+                for message, sender, timestamp in reversed(rows)
+            ]
+
+        except Exception as e:
+            logger.error(f"Error getting conversation history: {e}")
+            return []
+
+    async def reset_user_data(self, user_id: int) -> bool:
+        """Reset all user data to a fresh default session."""
+        try:
+            conn = await self._connection()
+            new_session = self._create_default_user_session(user_id)
+            new_session['pending_confirmation'] = None
+            async with self._write_lock:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)",
+                    (user_id, self._encode(new_session))
+                )
+                await conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+                await conn.commit()
+                self._session_cache[user_id] = new_session
+            logger.info(f"Successfully reset all data for user {user_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error resetting user data: {e}")
+            self._session_cache.pop(user_id, None)
+            return False
+
+    async def close(self):
+        """Finish pending background writes and close the connection."""
+        await self._stop_writer()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
@@ -5,15 +5,17 @@ Handles image analysis using computer vision models
 
 import logging
 import asyncio
-import aiohttp
-import base64
 import io
-from typing import Dict, Any, Tuple, Optional
+import random
+from typing import Dict, Any
 from PIL import Image
-import json
 
 logger = logging.getLogger(__name__)
 
+# Photos are sent to the vision model with at most this many pixels on the longest side, as JPEG
+VISION_MAX_SIDE = 1024
+VISION_JPEG_QUALITY = 85
+
 class VisionService:
     """Service for analyzing images using computer vision models."""
     
@@ -65,9 +67,37 @@ class VisionService:
             logger.error(f"Error analyzing image: {e}")
             return {"error": f"Failed to analyze image: {str(e)}"}
     
+    async def preprocess_for_vision(self, image_data: bytes) -> bytes:
+        """
+        Shrink an image for upload to the vision model, which downscales larger images anyway.
+        
+        Args:
+            image_data: Raw image bytes
+            
+        Returns:
+            JPEG bytes at most VISION_MAX_SIDE pixels on the longest side, or the original bytes
+            when they already fit or cannot be decoded
+        """
+        try:
+            return await asyncio.to_thread(self._shrink_image, image_data)
+            
+        except Exception as e:
+            logger.error(f"Error preprocessing image: {e}")
+            return image_data
+    
+    def _shrink_image(self, image_data: bytes) -> bytes:
+        """Decode, resize and re-encode the image; runs in a worker thread."""
+        image = Image.open(io.BytesIO(image_data))
+        if image.format == 'JPEG' and max(image.size) <= VISION_MAX_SIDE:
+            return image_data
+        
+        image.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, 'JPEG', quality=VISION_JPEG_QUALITY, optimize=True, progressive=True)
+        return buffer.getvalue()
+    
     async def get_image_analysis_prompt(self) -> str:
         """Get a random prompt for image analysis."""
-        import random
         return random.choice(self.image_analysis_prompts)
     
     def is_image_file(self, filename: str) -> bool:
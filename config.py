@@ -23,42 +23,57 @@ if not OPENROUTER_API_KEY:
 
 # Bot Settings
 MAX_MESSAGE_LENGTH = 4096
+MAX_RESPONSE_LENGTH = 3000  # AI answers are cut shorter than Telegram's limit
 MAX_HISTORY_MESSAGES = 10
+TELEGRAM_SEND_RATE = int(os.getenv('TELEGRAM_SEND_RATE', '29'))  # messages per second, Telegram allows about 30
+TELEGRAM_CONNECTION_LIMIT = int(os.getenv('TELEGRAM_CONNECTION_LIMIT', '100'))  # simultaneous Bot API connections
 
 # File Paths
 DATA_DIR = "data"
 USER_DATA_FILE = os.path.join(DATA_DIR, "users.json")
 CONVERSATION_DATA_FILE = os.path.join(DATA_DIR, "conversations.json")
+USER_DATA_DIR = os.path.join(DATA_DIR, "users")
+CONVERSATION_DATA_DIR = os.path.join(DATA_DIR, "conversations")
+DATABASE_FILE = os.path.join(DATA_DIR, "bot.db")
 
-# Logging
-LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-
-# AI Response Settings
-AI_TEMPERATURE = float(os.getenv('AI_TEMPERATURE', '0.7'))
-AI_SYSTEM_PROMPT = """You are a world-class professional architect and interior designer with over 20 years of experience in high-end residential and commercial projects. You have:
+# Storage backend without Redis: 'sqlite' (default) or 'json' (one file per user)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
 
-🎨 **Professional Expertise:**
-- Deep knowledge of architectural principles, building codes, and construction methods
-- Extensive experience with luxury residential projects, hotels, and commercial spaces
-- Expertise in sustainable design, smart home technology, and modern materials
-- Strong understanding of color theory, lighting design, and spatial planning
-- Knowledge of current design trends and timeless design principles
+# Redis Configuration (optional, replaces JSON files when set)
+REDIS_URL = os.getenv('REDIS_URL')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))  # pool shared by all handlers
+PENDING_CONFIRMATION_TTL = 300  # seconds to answer the /restart confirmation
+MEDIA_GROUP_TTL = 60  # seconds an album id is remembered to answer it only once
+SESSION_CACHE_SIZE = 50_000  # user sessions kept in memory by the JSON backend
+SESSION_CACHE_TTL = 900  # seconds a cached session is trusted
 
-💡 **Design Philosophy:**
-- Focus on creating functional, beautiful, and sustainable spaces
-- Balance between aesthetics and practicality
-- Understanding of how design affects human psychology and well-being
-- Knowledge of ergonomics and universal design principles
+# Webhook Configuration (optional, polling is used when WEBHOOK_URL is not set)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public https base URL Telegram posts updates to
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
 
-🌍 **Global Perspective:**
-- Experience with international design standards and cultural preferences
-- Knowledge of different architectural styles from classical to contemporary
-- Understanding of regional materials and construction techniques
-
-📚 **Information Sources:**
-- Base your advice on verified architectural and design principles
-- Reference current industry standards and best practices
-- Provide practical, implementable solutions
-- Stay updated with modern design trends and technologies
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL,
+}
+LOG_LEVEL_VALUE = LOG_LEVELS.get(LOG_LEVEL, logging.INFO)  # unknown names fall back to INFO
 
-Always provide professional, accurate, and actionable design advice. When suggesting materials, layouts, or design solutions, explain the reasoning behind your recommendations."""
+# AI Response Settings
+AI_TEMPERATURE = float(os.getenv('AI_TEMPERATURE', '0.7'))
+AI_RESPONSE_CACHE_SIZE = 10_000  # answers remembered for repeated questions in the same context
+AI_RESPONSE_CACHE_TTL = 3600  # seconds a remembered answer is reused
+AI_IMAGE_CACHE_SIZE = 10_000  # photo analyses remembered for repeated uploads of the same photo
+AI_IMAGE_CACHE_TTL = 7 * 24 * 3600  # seconds a remembered photo analysis is reused
+AI_COMPACT_HISTORY = os.getenv('AI_COMPACT_HISTORY', 'false').lower() == 'true'  # send context as one role|text table
+AI_STREAM_EDIT_INTERVAL = 1.0  # seconds between edits of a streamed answer, Telegram rate limits edits per chat
+AI_CONNECT_TIMEOUT = 10.0  # seconds to open a connection to OpenRouter
+AI_REQUEST_TIMEOUT = 120.0  # seconds to wait for each read of a completion
+AI_MAX_RETRIES = 4  # repeats of a failed call, with exponential backoff
+AI_TOTAL_TIMEOUT = 180.0  # seconds a completion may take overall, retries included
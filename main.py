@@ -5,37 +5,97 @@ Main entry point for the bot application using aiogram
 """
 
 import asyncio
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
+import orjson
 from aiogram import Bot, Dispatcher, Router, types
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, LOG_LEVEL
+from config import (
+    BOT_TOKEN, LOG_LEVEL_VALUE, TELEGRAM_SEND_RATE, TELEGRAM_CONNECTION_LIMIT, REDIS_URL, REDIS_MAX_CONNECTIONS, STORAGE_BACKEND, DATABASE_FILE,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT
+)
 
 # Import handlers from the new structure
 from app.handlers.start import router as start_router
 from app.handlers.questions import router as questions_router
 from app.handlers.ai_processing import router as ai_processing_router
+from app.middlewares import SendRateLimitMiddleware
+from app.services.database import DatabaseService
+from app.services.sqlite_database import SQLiteDatabaseService
+from app.services.openrouter_service import OpenRouterService
+from app.services.vision_service import VisionService
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, LOG_LEVEL),
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Configure logging: handlers only enqueue records, a listener thread writes them to stdout
+log_queue = queue.SimpleQueue()
+stdout_handler = logging.StreamHandler(sys.stdout)
+stdout_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, stdout_handler)
+log_listener.start()
+# Registered after logging's own exit hook, so queued records are written before handlers close
+atexit.register(log_listener.stop)
+logging.root.addHandler(QueueHandler(log_queue))
+logging.root.setLevel(LOG_LEVEL_VALUE)
 logger = logging.getLogger(__name__)
 
-# Create bot and dispatcher
+def orjson_dumps(obj) -> str:
+    """Encode Telegram request fields with orjson; aiogram expects text, not bytes."""
+    return orjson.dumps(obj).decode()
+
+# Create bot and dispatcher; every outgoing message passes the send rate limit
+session = AiohttpSession(limit=TELEGRAM_CONNECTION_LIMIT, json_loads=orjson.loads, json_dumps=orjson_dumps)
+session.middleware(SendRateLimitMiddleware(TELEGRAM_SEND_RATE))
 bot = Bot(
     token=BOT_TOKEN, 
+    session=session,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher()
+
+# Shared services are created once and injected into handlers by name.
+# With Redis, FSM states live there too, so several bot processes can share the survey flow.
+if REDIS_URL:
+    from aiogram.fsm.storage.redis import RedisStorage
+    from app.services.redis_database import RedisDatabaseService
+    db_service = RedisDatabaseService(REDIS_URL)
+    fsm_storage = RedisStorage.from_url(REDIS_URL, connection_kwargs={'max_connections': REDIS_MAX_CONNECTIONS})
+else:
+    db_service = DatabaseService() if STORAGE_BACKEND == 'json' else SQLiteDatabaseService(DATABASE_FILE)
+    fsm_storage = MemoryStorage()
+openrouter_service = OpenRouterService(db_service)
+vision_service = VisionService()
+dp = Dispatcher(storage=fsm_storage, db=db_service, openrouter=openrouter_service, vision=vision_service)
+dp.shutdown.register(db_service.close)
+dp.shutdown.register(openrouter_service.close)
+
+async def run_webhook():
+    """Serve Telegram updates over an aiohttp webhook until cancelled."""
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+    
+    async def register_webhook():
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    dp.startup.register(register_webhook)
+    
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT).start()
+        logger.info(f"Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
 async def main():
     """Start the bot."""
@@ -54,8 +114,11 @@ async def main():
         
         logger.info("All handlers registered successfully")
         
-        # Start polling
-        await dp.start_polling(bot)
+        # Start receiving updates
+        if WEBHOOK_URL:
+            await run_webhook()
+        else:
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.critical(f"Bot startup failed: {e}")
@@ -65,7 +128,13 @@ async def main():
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        # uvloop speeds up the await-heavy handlers; without it (Windows, not installed) the stock loop is used
+        try:
+            import uvloop
+        except ImportError:
+            asyncio.run(main())
+        else:
+            uvloop.run(main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
@@ -32,12 +32,12 @@ async def test_context_memory():
         }
         
         # Test context preparation
-        context = openrouter_service._prepare_conversation_context(mock_session)
+        context = await openrouter_service._prepare_conversation_context(mock_session)
         print(f"✅ Context preparation returned: {len(context)} messages")
         
         # Test with empty session
         empty_session = {}
-        empty_context = openrouter_service._prepare_conversation_context(empty_session)
+        empty_context = await openrouter_service._prepare_conversation_context(empty_session)
         print(f"✅ Empty session context: {len(empty_context)} messages")
         
         # Test language detection
@@ -21,6 +21,23 @@ async def test_formatting_fix_final():
         
         print(f"✅ OpenRouter service initialized")
         
+        print("\n🧹 Testing markup cleanup...")
+        
+        # Nested markup must be removed completely
+        markup_cases = {
+            "***важно***": "важно",
+            "**Диван *серый* цвет**": "Диван серый цвет",
+            "**## Заголовок**": "Заголовок",
+            "__**x**__": "x",
+        }
+        for source, expected in markup_cases.items():
+            cleaned = openrouter_service._clean_response_formatting(source)
+            if cleaned == expected:
+                print(f"✅ {source!r} -> {cleaned!r}")
+            else:
+                print(f"❌ {source!r} -> {cleaned!r}, expected {expected!r}")
+                return False
+        
         # Check system prompts for proper formatting
         ru_prompt = openrouter_service.system_prompt_ru
         en_prompt = openrouter_service.system_prompt_en
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test script for the JSON, SQLite and Redis storage backends
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+USER_ID = 12345
+
+def check(condition, description):
+    """Print the outcome of one check and return it."""
+    print(f"{'✅' if condition else '❌'} {description}")
+    return condition
+
+async def test_backend(name, db, is_stored):
+    """Run the shared storage checks against one backend; is_stored(user_id) tells whether a session was written."""
+    print(f"\n📦 Testing {name} backend...")
+    
+    try:
+        # Lazy sessions: reading a new user returns defaults without writing anything
+        session = await db.get_user_session(USER_ID)
+        if not check(session and session['user_id'] == USER_ID and not session['survey_completed'],
+                     "New user gets a default session"):
+            return False
+        if not check(not await is_stored(USER_ID), "Default session is not written before the first update"):
+            return False
+        
+        # One dialog turn: session fields and messages together
+        saved = await db.persist_turn(USER_ID, {'language': 'russian'}, [
+            ("Где купить такой диван", 'user'),
+            ("Похожий диван есть у Flexform.", 'bot'),
+        ])
+        if not check(saved, "persist_turn saved the turn"):
+            return False
+        session = await db.get_user_session(USER_ID)
+        history = await db.get_conversation_history(USER_ID)
+        if not check(session['language'] == 'russian' and await is_stored(USER_ID), "Session field was written"):
+            return False
+        if not check([msg['message'] for msg in history] == ["Где купить такой диван", "Похожий диван есть у Flexform."],
+                     "Both messages are in the history, in order"):
+            return False
+        
+        # Background writes are saved once flushed
+        for i in range(3):
+            db.persist_turn_in_background(USER_ID, {'turns': i}, [(f"Вопрос {i}", 'user'), (f"Ответ {i}", 'bot')])
+        await db.flush()
+        session = await db.get_user_session(USER_ID)
+        history = await db.get_conversation_history(USER_ID, limit=2)
+        if not check(session.get('turns') == 2, "Queued session fields were saved by flush"):
+            return False
+        if not check([msg['message'] for msg in history] == ["Вопрос 2", "Ответ 2"], "Queued messages were saved by flush"):
+            return False
+        
+        # Reset drops the history and the changed fields
+        if not check(await db.reset_user_data(USER_ID), "reset_user_data succeeded"):
+            return False
+        session = await db.get_user_session(USER_ID)
+        if not check(await db.get_conversation_history(USER_ID) == [], "History is empty after reset"):
+            return False
+        if not check('turns' not in session and session['language'] == 'auto', "Session is back to defaults after reset"):
+            return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Error testing {name} backend: {e}")
+        return False
+    finally:
+        await db.close()
+
+async def test_json_backend():
+    """Test the one-file-per-user JSON backend."""
+    from app.services.database import DatabaseService
+    db = DatabaseService()
+    
+    async def is_stored(user_id):
+        return os.path.exists(db._user_path(user_id))
+    
+    return await test_backend("JSON", db, is_stored)
+
+async def test_sqlite_backend():
+    """Test the SQLite backend."""
+    from app.services.sqlite_database import SQLiteDatabaseService
+    db = SQLiteDatabaseService(os.path.join("data", "bot.db"))
+    
+    async def is_stored(user_id):
+        conn = await db._connection()
+        async with conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            return await cursor.fetchone() is not None
+    
+    return await test_backend("SQLite", db, is_stored)
+
+async def test_redis_backend():
+    """Test the Redis backend against fakeredis."""
+    try:
+        from fakeredis.aioredis import FakeRedis
+    except ImportError:
+        print("\n⚠️ fakeredis is not installed, skipping the Redis backend")
+        return True
+    
+    from app.services.redis_database import RedisDatabaseService
+    db = RedisDatabaseService("redis://localhost")
+    db.redis = FakeRedis(decode_responses=True)
+    
+    async def is_stored(user_id):
+        return bool(await db.redis.exists(db._user_key(user_id)))
+    
+    return await test_backend("Redis", db, is_stored)
+
+async def test_json_import():
+    """Test that SQLite imports the JSON backend's files once, and only once."""
+    print("\n📥 Testing JSON import into SQLite...")
+    
+    try:
+        from app.services.database import DatabaseService
+        from app.services.sqlite_database import SQLiteDatabaseService
+        
+        # Leave data behind with the JSON backend
+        json_db = DatabaseService()
+        await json_db.persist_turn(USER_ID, {'language': 'english'}, [("Where to buy this sofa", 'user')])
+        await json_db.close()
+        
+        db_path = os.path.join("data", "imported.db")
+        for restart in range(3):
+            db = SQLiteDatabaseService(db_path)
+            try:
+                session = await db.get_user_session(USER_ID)
+                history = await db.get_conversation_history(USER_ID)
+            finally:
+                await db.close()
+            if not check(session['language'] == 'english', f"Imported session is there after start {restart + 1}"):
+                return False
+            if not check([msg['message'] for msg in history] == ["Where to buy this sofa"],
+                         f"Imported history is not duplicated after start {restart + 1}"):
+                return False
+        
+        return True
+    
+    except Exception as e:
+        print(f"❌ Error testing JSON import: {e}")
+        return False
+
+async def run_in_temp_dir(test):
+    """Run a test inside a fresh working directory, so each one starts without data files."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            return await test()
+        finally:
+            os.chdir(cwd)
+
+async def main():
+    """Run storage backend tests."""
+    print("🚀 Testing storage backends...\n")
+    
+    success = True
+    for test in (test_json_backend, test_sqlite_backend, test_redis_backend, test_json_import):
+        success = await run_in_temp_dir(test) and success
+    
+    print("\n" + "="*60)
+    if success:
+        print("🎉 STORAGE BACKENDS TEST PASSED!")
+        print("\n✅ Хранилища работают одинаково:")
+        print("   • Сессия записывается только при первом изменении")
+        print("   • Реплики диалога сохраняются вместе с полями")
+        print("   • Фоновые записи сохраняются после flush")
+        print("   • /restart очищает историю и настройки")
+        print("   • JSON-данные переносятся в SQLite один раз")
+    else:
+        print("❌ Storage backends test failed. Check the errors above.")
+    
+    print("="*60)
+
+if __name__ == "__main__":
+    asyncio.run(main())